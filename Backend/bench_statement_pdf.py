@@ -0,0 +1,43 @@
+# bench_statement_pdf.py — per-PDF CPU time of the statement renderer, cold vs cached template
+# Usage: python bench_statement_pdf.py [rows] [repeats]
+import os, sys, time
+from datetime import date, timedelta
+
+# main builds its DB engine at import; nothing here connects
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://bench@localhost/bench")
+import main
+
+def sample_rows(n: int):
+    start = date(2024, 1, 1)
+    return [
+        (start + timedelta(days=i % 365), f"Sample entry {i}", float(i % 50) if i % 3 else 0.0, 0.0 if i % 3 else 25.0)
+        for i in range(n)
+    ]
+
+def bench(rows, repeats: int, cold: bool) -> float:
+    total_credit = sum(r[2] for r in rows)
+    total_debit = sum(r[3] for r in rows)
+    samples = []
+    for _ in range(repeats):
+        t = time.process_time()
+        if cold:
+            # what every request paid before the template cache: fresh styles/logo, ASCII85 image streams
+            main._statement_template = None
+            main._statement_pdf_template()
+            main.rl_config.useA85 = 1
+        main.render_statement_pdf("CL-BENCH", "01-Jan-2025", 0.0, total_credit, total_debit, None, rows)
+        samples.append(time.process_time() - t)
+    main.rl_config.useA85 = 0
+    samples.sort()
+    return samples[len(samples) // 2]
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rows = sample_rows(n)
+    main.render_statement_pdf("CL-BENCH", "01-Jan-2025", 0.0, 0.0, 0.0, None, rows)  # warm imports / fonts
+    cold = bench(rows, repeats, cold=True)
+    warm = bench(rows, repeats, cold=False)
+    print(f"{n} rows, median of {repeats}")
+    print(f"  template rebuilt per PDF : {cold * 1000:8.2f} ms CPU")
+    print(f"  cached template          : {warm * 1000:8.2f} ms CPU  ({(1 - warm / cold) * 100:.0f}% less)")
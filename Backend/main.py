@@ -1,10 +1,10 @@
 # main.py — Your Ideal (FastAPI Backend) — DB version (Async SQLAlchemy, no auto-create)
 # Python 3.10+
-import os, json, uuid, calendar, bcrypt
-from datetime import datetime, date
+import os, re, json, uuid, calendar, bcrypt, base64, time, asyncio
+from datetime import datetime, date, timedelta
 from typing import Optional, Dict, List
 
-from fastapi import FastAPI, HTTPException, Header, APIRouter, Depends, Request, UploadFile, File
+from fastapi import FastAPI, HTTPException, Header, APIRouter, Depends, Request, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 
@@ -13,26 +13,34 @@ from pydantic import BaseModel
 
 # PDF / CSV
 from io import BytesIO, StringIO
+from reportlab import rl_config
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from xml.sax.saxutils import escape as xml_escape
 
 # SQLAlchemy Async
 from sqlalchemy import (
     Column, String, Integer, Date, Boolean, DateTime, Text, text, Numeric,
-    ForeignKey, func, and_, update, select, delete
+    ForeignKey, func, and_, update, select, delete, true, tuple_,
+    literal_column, case, union_all, Sequence, bindparam,
 )
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, aliased
 from fastapi.responses import JSONResponse
 import traceback
 from fastapi.responses import Response
-import io, csv
+import io, csv, shutil, tempfile, gzip, zipfile, zlib, multiprocessing, hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # -------------------------------------------------------------------
 # App & CORS
@@ -45,7 +53,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"],
+    expose_headers=["Content-Disposition", "ETag"],
 )
 
 api = APIRouter(prefix="/api")
@@ -172,6 +180,8 @@ class Service(Base):
     pa = Column(JSONB, nullable=True)        # list
     optional = Column(JSONB, nullable=True)  # list
     created_by = Column(String, nullable=True)
+    # bumped by trigger on every service update and statement write; keys cached exports
+    ledger_version = Column(Integer, nullable=False, server_default=text("0"))
 
 class Statement(Base):
     __tablename__ = "statements"
@@ -184,6 +194,13 @@ class Statement(Base):
     debit = Column(Numeric(12, 2), default=0)
     enteredBy = Column("enteredBy", String)  # ✅ exact field name retained
     created_at = Column(DateTime, default=datetime.utcnow)
+    # idempotency key for system-generated fees (NULL for ordinary rows);
+    # unique per (serviceId, kind, period) via ux_statements_fee_key
+    kind = Column(String, nullable=True)     # monthly / initial / pension_setup / pension / year_end
+    period = Column(Date, nullable=True)     # first day of the month the fee belongs to
+    # duplicate-detection key: yi.statement_content_hash(date, description, credit, debit);
+    # unique per service via ux_statements_content, NULL on later copies of the same content
+    content_hash = Column(String, nullable=True)
 
 class ServiceNote(Base):
     __tablename__ = "notes"
@@ -204,6 +221,435 @@ class Notification(Base):
     category = Column(String, nullable=True)
     timestamp = Column(DateTime, nullable=True)
 
+class AppliedMigration(Base):
+    # schema patches and one-off data backfills already run against this database
+    __tablename__ = "applied_migrations"
+    __table_args__ = {'schema': 'yi'}
+    name = Column(String, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class JobState(Base):
+    # background job bookkeeping, shared by all workers
+    __tablename__ = "job_state"
+    __table_args__ = {'schema': 'yi'}
+    name = Column(String, primary_key=True)
+    watermark = Column(Date, nullable=True)          # last month fully processed
+    last_started_at = Column(DateTime, nullable=True)
+    last_finished_at = Column(DateTime, nullable=True)
+    last_duration_ms = Column(Integer, nullable=True)
+    last_result = Column(Integer, nullable=True)     # rows inserted by the last pass
+    last_error = Column(Text, nullable=True)
+
+class ImportJob(Base):
+    # background CSV imports; progress lives here so any worker can answer GET /api/jobs/{id}
+    __tablename__ = "jobs"
+    __table_args__ = {'schema': 'yi'}
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(String, nullable=False)              # statement_import
+    status = Column(String, nullable=False)            # queued / running / done / failed
+    filename = Column(String, nullable=True)
+    created_by = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)       # refreshed after every chunk
+    rows_parsed = Column(Integer, nullable=False, default=0)
+    rows_inserted = Column(Integer, nullable=False, default=0)
+    rows_skipped = Column(Integer, nullable=False, default=0)
+    result = Column(JSONB, nullable=True)              # final upload summary
+    error = Column(Text, nullable=True)
+
+class ServiceCounter(Base):
+    # per-client serviceId suffix allocator (SV-<clientId>-NNNN)
+    __tablename__ = "service_counters"
+    __table_args__ = {'schema': 'yi'}
+    client_id = Column(String, ForeignKey("yi.clients.id", ondelete="CASCADE"), primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
+
+class ServiceMonthSpend(Base):
+    # per-(service, month) statement totals and closing balance, kept current by the
+    # trg_statements_spend_* triggers
+    __tablename__ = "service_month_spend"
+    __table_args__ = {'schema': 'yi'}
+    service_id = Column(String, primary_key=True)
+    month = Column(Date, primary_key=True)           # first day of the month
+    debit = Column(Numeric(14, 2), nullable=False, server_default=text("0"))
+    credit = Column(Numeric(14, 2), nullable=False, server_default=text("0"))
+    entries = Column(Integer, nullable=False, server_default=text("0"))
+    # last alert state per budget; an alert is logged only when one flips to true
+    setup_exceeded = Column(Boolean, nullable=False, server_default=text("false"))
+    carer_exceeded = Column(Boolean, nullable=False, server_default=text("false"))
+    agency_exceeded = Column(Boolean, nullable=False, server_default=text("false"))
+    # running ledger balance at the end of the month (all dated rows up to and including it)
+    closing_balance = Column(Numeric(14, 2), nullable=False, server_default=text("0"))
+
+# id sequences (created by create_all, synced to existing ids by DATA_MIGRATIONS)
+CLIENT_ID_SEQ = Sequence("client_id_seq", schema="yi", metadata=Base.metadata)
+COUNCIL_ID_SEQ = Sequence("council_id_seq", schema="yi", metadata=Base.metadata)
+
+# -------------------------------------------------------------------
+# Schema patches (indexes / columns create_all won't add to existing tables)
+# Each runs once per database, recorded in yi.applied_migrations under a hash of its
+# text, so editing a patch (e.g. a function body) runs just that patch again.
+# -------------------------------------------------------------------
+SCHEMA_PATCHES: List[str] = [
+    # latest address / kin per client (LATERAL lookups in _client_json_query)
+    "CREATE INDEX IF NOT EXISTS ix_client_address_client_created ON yi.client_address (client_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_client_kin_client_created ON yi.client_kin (client_id, created_at DESC)",
+    # keyset pagination / filters for GET /api/clients
+    "CREATE INDEX IF NOT EXISTS ix_clients_name_id ON yi.clients "
+    "(lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '')), id)",
+    'CREATE INDEX IF NOT EXISTS ix_clients_council ON yi.clients ("councilId")',
+    "CREATE INDEX IF NOT EXISTS ix_clients_status ON yi.clients (lower(status))",
+
+    # client search (pg_trgm); must stay identical to _client_search_doc / _postcode_search_key
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_clients_search_trgm ON yi.clients USING gin ("
+    "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || id || ' ' || "
+    "coalesce(email, '') || ' ' || regexp_replace(coalesce(phone, ''), '[^0-9]', '', 'g')) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_client_address_postcode_trgm ON yi.client_address USING gin ("
+    "lower(replace(coalesce(postcode, ''), ' ', '')) gin_trgm_ops) WHERE is_current",
+    # ledger order per service; must stay identical to _ledger_sort_keys. credit/debit are
+    # included so opening-balance sums are index-only scans
+    "CREATE INDEX IF NOT EXISTS ix_statements_ledger ON yi.statements "
+    "(\"serviceId\", coalesce(date, 'infinity'::date), coalesce(created_at, '-infinity'::timestamp), id) "
+    "INCLUDE (credit, debit)",
+    # undated rows, which the monthly rollup never sees (client report totals)
+    'CREATE INDEX IF NOT EXISTS ix_statements_undated ON yi.statements ("serviceId") '
+    "INCLUDE (credit, debit) WHERE date IS NULL",
+    "DROP INDEX IF EXISTS yi.ix_statements_service_date",
+    # system fee idempotency key
+    "ALTER TABLE yi.statements ADD COLUMN IF NOT EXISTS kind text",
+    "ALTER TABLE yi.statements ADD COLUMN IF NOT EXISTS period date",
+    'CREATE UNIQUE INDEX IF NOT EXISTS ux_statements_fee_key ON yi.statements ("serviceId", kind, period) '
+    "WHERE kind IS NOT NULL",
+    # content key for CSV duplicate detection. Computed only in SQL so every writer agrees;
+    # the BEFORE trigger fills it for writers that don't supply it (first copy wins, later
+    # identical rows keep NULL), the CSV import supplies it and lets ON CONFLICT skip duplicates.
+    # When the holder is deleted or edited, the AFTER trigger passes the hash to a surviving copy
+    "ALTER TABLE yi.statements ADD COLUMN IF NOT EXISTS content_hash text",
+    """
+    CREATE OR REPLACE FUNCTION yi.statement_content_hash(d date, descr text, cr numeric, db numeric)
+    RETURNS text AS $$
+        SELECT md5(coalesce(to_char(d, 'YYYY-MM-DD'), '') || '|' || lower(btrim(coalesce(descr, ''))) || '|'
+                   || coalesce(cr, 0)::numeric(14,2)::text || '|' || coalesce(db, 0)::numeric(14,2)::text)
+    $$ LANGUAGE sql STABLE
+    """,
+    'CREATE UNIQUE INDEX IF NOT EXISTS ux_statements_content ON yi.statements ("serviceId", content_hash) '
+    "WHERE content_hash IS NOT NULL",
+    """
+    CREATE OR REPLACE FUNCTION yi.statements_content_hash_fill() RETURNS trigger AS $$
+    DECLARE
+        h text;
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            IF NEW."serviceId" = OLD."serviceId" AND NEW.date IS NOT DISTINCT FROM OLD.date
+               AND NEW.description IS NOT DISTINCT FROM OLD.description
+               AND NEW.credit IS NOT DISTINCT FROM OLD.credit AND NEW.debit IS NOT DISTINCT FROM OLD.debit THEN
+                RETURN NEW;
+            END IF;
+            NEW.content_hash := NULL;
+        END IF;
+        IF NEW.content_hash IS NULL THEN
+            h := yi.statement_content_hash(NEW.date, NEW.description, NEW.credit, NEW.debit);
+            IF NOT EXISTS (SELECT 1 FROM yi.statements
+                           WHERE "serviceId" = NEW."serviceId" AND content_hash = h AND id <> NEW.id) THEN
+                NEW.content_hash := h;
+            END IF;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_statements_content_hash') THEN
+            CREATE TRIGGER trg_statements_content_hash BEFORE INSERT OR UPDATE ON yi.statements
+            FOR EACH ROW EXECUTE FUNCTION yi.statements_content_hash_fill();
+        END IF;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION yi.statements_content_hash_handoff() RETURNS trigger AS $$
+    BEGIN
+        IF OLD.content_hash IS NULL OR (TG_OP = 'UPDATE' AND NEW."serviceId" = OLD."serviceId"
+                                        AND NEW.content_hash IS NOT DISTINCT FROM OLD.content_hash) THEN
+            RETURN NULL;
+        END IF;
+        -- oldest unhashed copy of the same content left in the service takes over the key
+        UPDATE yi.statements SET content_hash = OLD.content_hash
+        WHERE id = (
+            SELECT id FROM yi.statements
+            WHERE "serviceId" = OLD."serviceId" AND content_hash IS NULL
+              AND yi.statement_content_hash(date, description, credit, debit) = OLD.content_hash
+            ORDER BY created_at NULLS LAST, id
+            LIMIT 1
+        )
+        AND NOT EXISTS (SELECT 1 FROM yi.statements
+                        WHERE "serviceId" = OLD."serviceId" AND content_hash = OLD.content_hash);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_statements_content_hash_handoff') THEN
+            CREATE TRIGGER trg_statements_content_hash_handoff AFTER UPDATE OR DELETE ON yi.statements
+            FOR EACH ROW EXECUTE FUNCTION yi.statements_content_hash_handoff();
+        END IF;
+    END $$
+    """,
+    # export cache key: any service update bumps ledger_version (the statement triggers below
+    # bump it too); an update that already moves it, like the statement bump, is left alone
+    "ALTER TABLE yi.services ADD COLUMN IF NOT EXISTS ledger_version integer NOT NULL DEFAULT 0",
+    """
+    CREATE OR REPLACE FUNCTION yi.services_ledger_version_bump() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.ledger_version IS NOT DISTINCT FROM OLD.ledger_version THEN
+            NEW.ledger_version := OLD.ledger_version + 1;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_services_ledger_version') THEN
+            CREATE TRIGGER trg_services_ledger_version BEFORE UPDATE ON yi.services
+            FOR EACH ROW EXECUTE FUNCTION yi.services_ledger_version_bump();
+        END IF;
+    END $$
+    """,
+    # monthly spend rollup + closing-balance snapshots: statement-level triggers fold each
+    # write's transition table into yi.service_month_spend inside the writing transaction
+    "ALTER TABLE yi.service_month_spend ADD COLUMN IF NOT EXISTS closing_balance numeric(14,2) NOT NULL DEFAULT 0",
+    """
+    CREATE OR REPLACE FUNCTION yi.service_month_closing_refresh(p_service text, p_from date) RETURNS void AS $$
+        UPDATE yi.service_month_spend t SET closing_balance = c.closing
+        FROM (
+            SELECT month,
+                   COALESCE((SELECT p.closing_balance FROM yi.service_month_spend p
+                             WHERE p.service_id = p_service AND p.month < p_from
+                             ORDER BY p.month DESC LIMIT 1), 0)
+                   + sum(credit - debit) OVER (ORDER BY month) AS closing
+            FROM yi.service_month_spend
+            WHERE service_id = p_service AND month >= p_from
+        ) c
+        WHERE t.service_id = p_service AND t.month = c.month
+          AND t.closing_balance IS DISTINCT FROM c.closing
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION yi.statements_spend_rollup() RETURNS trigger AS $$
+    DECLARE
+        r record;
+    BEGIN
+        -- per-service xact lock (namespace 'YISP'): closing refreshes for one service never interleave
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM pg_advisory_xact_lock(1497977680, hashtext(x.sid))
+            FROM (SELECT DISTINCT "serviceId" AS sid FROM old_rows ORDER BY 1) x;
+            INSERT INTO yi.service_month_spend AS t (service_id, month, debit, credit, entries)
+            SELECT "serviceId", date_trunc('month', date)::date,
+                   -sum(coalesce(debit, 0)), -sum(coalesce(credit, 0)), -count(*)
+            FROM old_rows WHERE date IS NOT NULL
+            GROUP BY 1, 2 ORDER BY 1, 2
+            ON CONFLICT (service_id, month) DO UPDATE
+            SET debit = t.debit + EXCLUDED.debit, credit = t.credit + EXCLUDED.credit,
+                entries = t.entries + EXCLUDED.entries;
+            FOR r IN SELECT "serviceId" AS sid, min(date_trunc('month', date))::date AS m0
+                     FROM old_rows WHERE date IS NOT NULL GROUP BY 1 LOOP
+                PERFORM yi.service_month_closing_refresh(r.sid, r.m0);
+            END LOOP;
+            UPDATE yi.services SET ledger_version = ledger_version + 1
+            WHERE "serviceId" IN (SELECT "serviceId" FROM old_rows);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM pg_advisory_xact_lock(1497977680, hashtext(x.sid))
+            FROM (SELECT DISTINCT "serviceId" AS sid FROM new_rows ORDER BY 1) x;
+            INSERT INTO yi.service_month_spend AS t (service_id, month, debit, credit, entries)
+            SELECT "serviceId", date_trunc('month', date)::date,
+                   sum(coalesce(debit, 0)), sum(coalesce(credit, 0)), count(*)
+            FROM new_rows WHERE date IS NOT NULL
+            GROUP BY 1, 2 ORDER BY 1, 2
+            ON CONFLICT (service_id, month) DO UPDATE
+            SET debit = t.debit + EXCLUDED.debit, credit = t.credit + EXCLUDED.credit,
+                entries = t.entries + EXCLUDED.entries;
+            FOR r IN SELECT "serviceId" AS sid, min(date_trunc('month', date))::date AS m0
+                     FROM new_rows WHERE date IS NOT NULL GROUP BY 1 LOOP
+                PERFORM yi.service_month_closing_refresh(r.sid, r.m0);
+            END LOOP;
+            UPDATE yi.services SET ledger_version = ledger_version + 1
+            WHERE "serviceId" IN (SELECT "serviceId" FROM new_rows);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_statements_spend_ins') THEN
+            CREATE TRIGGER trg_statements_spend_ins AFTER INSERT ON yi.statements
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION yi.statements_spend_rollup();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_statements_spend_upd') THEN
+            CREATE TRIGGER trg_statements_spend_upd AFTER UPDATE ON yi.statements
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION yi.statements_spend_rollup();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_statements_spend_del') THEN
+            CREATE TRIGGER trg_statements_spend_del AFTER DELETE ON yi.statements
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION yi.statements_spend_rollup();
+        END IF;
+    END $$
+    """,
+]
+
+# content hash backfill: the oldest copy of each (service, content) takes the hash unless a copy holds it
+STATEMENT_CONTENT_HASH_BACKFILL = """
+    UPDATE yi.statements st SET content_hash = f.h
+    FROM (
+        SELECT DISTINCT ON (x."serviceId", x.h) x.id, x.h
+        FROM (
+            SELECT id, "serviceId", created_at,
+                   yi.statement_content_hash(date, description, credit, debit) AS h
+            FROM yi.statements
+        ) x
+        ORDER BY x."serviceId", x.h, x.created_at NULLS LAST, x.id
+    ) f
+    WHERE st.id = f.id AND st.content_hash IS NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM yi.statements k WHERE k."serviceId" = st."serviceId" AND k.content_hash = f.h
+      )
+    """
+
+# one-off data backfills: (name, [sql, ...]); each runs once per database
+DATA_MIGRATIONS: List[tuple] = [
+    ("0001_statement_fee_keys", [
+        # key existing system fees; one keyed row per (service, kind, month), System rows first
+        """
+        UPDATE yi.statements st SET kind = f.kind, period = f.period
+        FROM (
+            SELECT DISTINCT ON (x."serviceId", x.kind, x.period) x.id, x.kind, x.period
+            FROM (
+                SELECT s.id, s."serviceId", s."enteredBy", s.created_at,
+                       date_trunc('month', s.date)::date AS period,
+                       CASE
+                           WHEN s.description ILIKE '%monthly fee%' THEN 'monthly'
+                           WHEN s.description ILIKE 'pension setup fee%' THEN 'pension_setup'
+                           WHEN s.description ILIKE 'annual pension fee%' THEN 'pension'
+                           WHEN s.description ILIKE 'annual year end fee%' THEN 'year_end'
+                           WHEN s."enteredBy" = 'System' AND s.description = sv."setupFee" THEN 'initial'
+                       END AS kind
+                FROM yi.statements s
+                JOIN yi.services sv ON sv."serviceId" = s."serviceId"
+                WHERE s.kind IS NULL AND s.date IS NOT NULL
+            ) x
+            WHERE x.kind IS NOT NULL
+            ORDER BY x."serviceId", x.kind, x.period, (x."enteredBy" = 'System') DESC, x.created_at, x.id
+        ) f
+        WHERE st.id = f.id
+          AND NOT EXISTS (
+              SELECT 1 FROM yi.statements k
+              WHERE k."serviceId" = st."serviceId" AND k.kind = f.kind AND k.period = f.period
+          )
+        """,
+    ]),
+    ("0002_service_month_spend", [
+        # seed the rollup from existing statements (triggers keep it current afterwards)
+        """
+        INSERT INTO yi.service_month_spend (service_id, month, debit, credit, entries)
+        SELECT "serviceId", date_trunc('month', date)::date,
+               sum(coalesce(debit, 0)), sum(coalesce(credit, 0)), count(*)
+        FROM yi.statements WHERE date IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (service_id, month) DO UPDATE
+        SET debit = EXCLUDED.debit, credit = EXCLUDED.credit, entries = EXCLUDED.entries
+        """,
+    ]),
+    ("0003_service_month_closing", [
+        """
+        UPDATE yi.service_month_spend t SET closing_balance = c.closing
+        FROM (
+            SELECT service_id, month,
+                   sum(credit - debit) OVER (PARTITION BY service_id ORDER BY month) AS closing
+            FROM yi.service_month_spend
+        ) c
+        WHERE t.service_id = c.service_id AND t.month = c.month
+        """,
+    ]),
+    # key existing rows: the oldest copy of each (service, content) holds the hash
+    ("0004_statement_content_hash", [STATEMENT_CONTENT_HASH_BACKFILL]),
+    # re-key copies orphaned before the handoff trigger existed (holder deleted or edited)
+    ("0005_statement_content_hash_orphans", [STATEMENT_CONTENT_HASH_BACKFILL]),
+    ("0006_id_allocator_sync", [
+        # id allocators: never hand out an id at or below what already exists
+        "SELECT setval('yi.client_id_seq', GREATEST(m.v, s.last_value), m.v > 0 OR s.is_called) "
+        "FROM yi.client_id_seq s, "
+        "(SELECT COALESCE(max(id::bigint), 0) AS v FROM yi.clients WHERE id ~ '^[0-9]{1,18}$') m",
+        "SELECT setval('yi.council_id_seq', GREATEST(m.v, s.last_value), m.v > 0 OR s.is_called) "
+        "FROM yi.council_id_seq s, (SELECT COALESCE(max(id), 0) AS v FROM yi.councils) m",
+        'INSERT INTO yi.service_counters (client_id, last_seq) '
+        'SELECT "clientId", max(substring("serviceId" from \'-([0-9]+)$\')::int) FROM yi.services '
+        'WHERE "serviceId" ~ \'-[0-9]+$\' GROUP BY "clientId" '
+        'ON CONFLICT (client_id) DO UPDATE SET last_seq = GREATEST(yi.service_counters.last_seq, EXCLUDED.last_seq)',
+    ]),
+]
+
+# pg advisory xact lock key ("YISM"): one worker applies pending patches, the rest wait for it
+SCHEMA_MIGRATION_LOCK_KEY = 0x5949534D
+
+TRGM_AVAILABLE = False
+
+def _schema_patch_name(ddl: str) -> str:
+    return "schema:" + hashlib.md5(ddl.encode()).hexdigest()[:16]
+
+async def _record_migration(conn, name: str):
+    await conn.execute(
+        pg_insert(AppliedMigration).values(name=name, applied_at=datetime.utcnow())
+        .on_conflict_do_nothing()
+    )
+
+async def apply_schema_patches(conn):
+    """
+    Apply the SCHEMA_PATCHES and DATA_MIGRATIONS not yet recorded in yi.applied_migrations.
+    A boot with nothing pending only reads that table: no DDL, no table locks, no backfills.
+    """
+    global TRGM_AVAILABLE
+    patches = [(_schema_patch_name(ddl), ddl) for ddl in SCHEMA_PATCHES]
+    done = set((await conn.execute(select(AppliedMigration.name))).scalars().all())
+    if any(name not in done for name, _ in patches) or any(name not in done for name, _ in DATA_MIGRATIONS):
+        # workers booting together: the first applies, the others wait and then find it recorded
+        await conn.execute(select(func.pg_advisory_xact_lock(SCHEMA_MIGRATION_LOCK_KEY)))
+        done = set((await conn.execute(select(AppliedMigration.name))).scalars().all())
+
+    # each patch in its own savepoint: a missing extension/privilege must not block startup
+    # (a skipped patch isn't recorded, so it is tried again on the next boot)
+    for name, ddl in patches:
+        if name in done:
+            continue
+        try:
+            async with conn.begin_nested():
+                await conn.execute(text(ddl))
+                await _record_migration(conn, name)
+        except Exception as e:
+            print(f"⚠ Schema patch skipped ({ddl.split(' ON ')[0].strip()}): {e.__class__.__name__}")
+    res = await conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+    TRGM_AVAILABLE = res.scalar() is not None
+
+    for name, statements in DATA_MIGRATIONS:
+        if name in done:
+            continue
+        try:
+            async with conn.begin_nested():
+                for sql in statements:
+                    await conn.execute(text(sql))
+                await _record_migration(conn, name)
+            print(f"✅ Data migration applied: {name}")
+        except Exception as e:
+            print(f"⚠ Data migration failed ({name}): {e.__class__.__name__}: {e}")
+
 # -----------------------------
 # Pydantic Models for Notes API
 # -----------------------------
@@ -299,78 +745,198 @@ def _check_password(user: Dict, plain_password: str) -> bool:
     except Exception:
         return False
 
-async def ensure_monthly_debits(db: AsyncSession):
+# one pass for every service: expected months (generate_series) anti-joined
+# against existing fee keys, inserted in bulk (ON CONFLICT covers concurrent runs).
+# Fees entered by hand (add_statement / CSV upload) carry no key, so a
+# "Monthly Fee" row in the month still counts, matched by text as before.
+MONTHLY_DEBITS_SQL = text("""
+    INSERT INTO yi.statements (id, "serviceId", date, description, credit, debit, "enteredBy", created_at,
+                               kind, period)
+    SELECT gen_random_uuid()::text, s."serviceId", m.month::date,
+           'Monthly Fee - ' || to_char(m.month, 'Mon YYYY'),
+           0, s."monthlyFee", 'System', (now() AT TIME ZONE 'utc'),
+           'monthly', m.month::date
+    FROM yi.services s
+    CROSS JOIN LATERAL generate_series(
+        -- GREATEST ignores NULL, so :since = NULL means "from the service start"
+        GREATEST(date_trunc('month', COALESCE(s."startDate", :today)), CAST(:since AS timestamp)),
+        date_trunc('month', LEAST(COALESCE(s."endDate", :today), :today)),
+        interval '1 month'
+    ) AS m(month)
+    WHERE s."monthlyFee" IS NOT NULL AND s."monthlyFee" <> 0
+      AND COALESCE(s."endDate", :today) >= COALESCE(s."startDate", :today)
+      AND (CAST(:service_id AS text) IS NULL OR s."serviceId" = :service_id)
+      AND (CAST(:since AS date) IS NULL OR m.month >= CAST(:since AS date))
+      AND NOT EXISTS (
+          SELECT 1 FROM yi.statements st
+          WHERE st."serviceId" = s."serviceId" AND st.kind = 'monthly' AND st.period = m.month::date
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM yi.statements st
+          WHERE st."serviceId" = s."serviceId"
+            AND coalesce(st.date, 'infinity'::date) >= m.month::date
+            AND coalesce(st.date, 'infinity'::date) < (m.month + interval '1 month')::date
+            AND st.description ILIKE '%monthly fee%'
+      )
+    ON CONFLICT ("serviceId", kind, period) WHERE kind IS NOT NULL DO NOTHING
+""").bindparams(
+    bindparam("today", type_=Date),
+    bindparam("since", type_=Date),
+    bindparam("service_id", type_=String),
+)
+
+async def ensure_monthly_debits(db: AsyncSession, since: Optional[date] = None,
+                                service_id: Optional[str] = None) -> int:
     """
     Ensures that every active service has a monthly fee statement
     for each month between its startDate and endDate (or current date).
+    `since` limits the pass to months from that month on (scheduler watermark);
+    `service_id` limits it to one service.
+    Returns the number of statements inserted.
     """
     print("🔁 Running monthly fee auto-debit check...")
 
-    today = date.today()
-    res = await db.execute(select(Service))
-    services = res.scalars().all()
-    created = 0
+    res = await db.execute(MONTHLY_DEBITS_SQL, {
+        "today": date.today(),
+        "since": first_day_of_month(since) if since else None,
+        "service_id": service_id,
+    })
+    created = res.rowcount or 0
 
-    for svc in services:
-        if not svc.monthlyFee or svc.monthlyFee == 0:
-            continue
+    await db.commit()
+    print(f"✅ Auto-debit complete: {created} new monthly entries added.")
+    return created
 
-        start = svc.startDate or today
-        end = svc.endDate or today
-        if end < start:
-            continue
+# -------------------------------------------------------------------
+# MONTHLY DEBIT SCHEDULER (in-process, off the request path)
+# -------------------------------------------------------------------
+MONTHLY_DEBIT_JOB = "monthly_debits"
+MONTHLY_DEBIT_INTERVAL_SECONDS = int(os.getenv("MONTHLY_DEBIT_INTERVAL_SECONDS", "3600"))
+# pg advisory lock key ("YIMD"): one worker per pass across all uvicorn workers / hosts
+MONTHLY_DEBIT_LOCK_KEY = 0x59494D44
+
+_monthly_debit_lock = asyncio.Lock()
+_monthly_debit_task: Optional[asyncio.Task] = None
+_monthly_debit_next_run: Optional[datetime] = None
+
+async def _save_job_state(db: AsyncSession, name: str, **fields):
+    stmt = pg_insert(JobState).values(name=name, **fields)
+    stmt = stmt.on_conflict_do_update(index_elements=[JobState.name], set_=fields)
+    await db.execute(stmt)
+    await db.commit()
+
+def _job_state_to_json(st: Optional[JobState]) -> Dict:
+    def ts(v):
+        return v.isoformat(timespec="seconds") if v else None
+    return {
+        "name": MONTHLY_DEBIT_JOB,
+        "watermark": st.watermark.isoformat() if st and st.watermark else None,
+        "last_started_at": ts(st.last_started_at) if st else None,
+        "last_finished_at": ts(st.last_finished_at) if st else None,
+        "last_duration_ms": st.last_duration_ms if st else None,
+        "last_inserted": st.last_result if st else None,
+        "last_error": st.last_error if st else None,
+    }
+
+async def run_monthly_debit_job(full: bool = False) -> Dict:
+    """
+    One scheduler pass. Only months from the stored watermark (last processed
+    month) onward are examined unless `full` is set.
+    If another worker holds the advisory lock the pass is skipped
+    (returned status has "skipped": True).
+    """
+    async with _monthly_debit_lock, engine.connect() as lock_conn:
+        got = (await lock_conn.execute(select(func.pg_try_advisory_lock(MONTHLY_DEBIT_LOCK_KEY)))).scalar()
+        await lock_conn.commit()
+        if not got:
+            async with AsyncSessionLocal() as db:
+                out = _job_state_to_json(await db.get(JobState, MONTHLY_DEBIT_JOB))
+            out["skipped"] = True
+            return out
+        try:
+            return await _run_monthly_debit_pass(full)
+        finally:
+            await lock_conn.execute(select(func.pg_advisory_unlock(MONTHLY_DEBIT_LOCK_KEY)))
+            await lock_conn.commit()
 
-        # iterate months from start → end/current
-        year, month = start.year, start.month
-        while (year < end.year) or (year == end.year and month <= end.month):
-            month_date = date(year, month, 1)
-
-            # skip future months
-            if month_date > today:
-                break
-
-            # check if monthly fee already exists for this month
-            res2 = await db.execute(
-                select(func.count())
-                .select_from(Statement)
-                .where(
-                    and_(
-                        Statement.serviceId == svc.serviceId,
-                        func.date_part("year", Statement.date) == year,
-                        func.date_part("month", Statement.date) == month,
-                        Statement.description.ilike("%monthly fee%"),
-                    )
-                )
+async def _run_monthly_debit_pass(full: bool) -> Dict:
+    async with AsyncSessionLocal() as db:
+        state = await db.get(JobState, MONTHLY_DEBIT_JOB)
+        since = None if full or not state else state.watermark
+        started = datetime.utcnow()
+        t0 = time.perf_counter()
+        await _save_job_state(db, MONTHLY_DEBIT_JOB, last_started_at=started)
+        try:
+            created = await ensure_monthly_debits(db, since=since)
+        except Exception as e:
+            await db.rollback()
+            await _save_job_state(
+                db, MONTHLY_DEBIT_JOB,
+                last_finished_at=datetime.utcnow(),
+                last_duration_ms=int((time.perf_counter() - t0) * 1000),
+                last_error=f"{e.__class__.__name__}: {e}",
             )
-            already = res2.scalar_one()
-            if not already:
-                stmt = Statement(
-                    id=str(uuid.uuid4()),
-                    serviceId=svc.serviceId,
-                    date=month_date,
-                    description=f"Monthly Fee - {calendar.month_abbr[month]} {year}",
-                    credit=0,
-                    debit=float(svc.monthlyFee),
-                    enteredBy="System",
-                    created_at=datetime.utcnow(),
-                )
-                db.add(stmt)
-                created += 1
-
-            # next month
-            if month == 12:
-                year += 1
-                month = 1
-            else:
-                month += 1
+            raise
+        await _save_job_state(
+            db, MONTHLY_DEBIT_JOB,
+            watermark=first_day_of_month(date.today()),
+            last_finished_at=datetime.utcnow(),
+            last_duration_ms=int((time.perf_counter() - t0) * 1000),
+            last_result=created,
+            last_error=None,
+        )
+        db.expunge_all()
+        return _job_state_to_json(await db.get(JobState, MONTHLY_DEBIT_JOB))
 
-    await db.commit()
-    print(f"✅ Auto-debit complete: {created} new monthly entries added.")
+async def _monthly_debit_scheduler():
+    global _monthly_debit_next_run
+    while True:
+        try:
+            await run_monthly_debit_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            print("❌ Monthly debit job failed")
+            traceback.print_exc()
+        _monthly_debit_next_run = datetime.utcnow() + timedelta(seconds=MONTHLY_DEBIT_INTERVAL_SECONDS)
+        await asyncio.sleep(MONTHLY_DEBIT_INTERVAL_SECONDS)
+
+# -------------------------------------------------------------------
+# ID ALLOCATION (sequences / counter rows; O(1) and safe across workers)
+# -------------------------------------------------------------------
+async def next_client_id(db: AsyncSession) -> str:
+    n = (await db.execute(select(CLIENT_ID_SEQ.next_value()))).scalar_one()
+    return f"{n:010d}"
+
+async def bump_client_id_seq(db: AsyncSession, client_id: str):
+    # manually entered numeric ids push the sequence forward so it never re-issues them
+    if not client_id.isdigit() or len(client_id) > 18:
+        return
+    await db.execute(
+        text("SELECT setval('yi.client_id_seq', :n) WHERE :n > (SELECT last_value FROM yi.client_id_seq)"),
+        {"n": int(client_id)},
+    )
+
+async def next_council_id(db: AsyncSession) -> int:
+    return (await db.execute(select(COUNCIL_ID_SEQ.next_value()))).scalar_one()
+
+async def next_service_id(db: AsyncSession, client_id: str) -> str:
+    stmt = (
+        pg_insert(ServiceCounter)
+        .values(client_id=client_id, last_seq=1)
+        .on_conflict_do_update(
+            index_elements=[ServiceCounter.client_id],
+            set_={"last_seq": ServiceCounter.last_seq + 1},
+        )
+        .returning(ServiceCounter.last_seq)
+    )
+    seq = (await db.execute(stmt)).scalar_one()
+    return f"SV-{client_id}-{seq:04d}"
 
 # -------------------------------------------------------------------
 # LOGGING & NOTIFICATIONS (DB)
 # -------------------------------------------------------------------
-async def log_activity(db: AsyncSession, username: str, action: str, category: str = "general"):
+async def log_activity(db: AsyncSession, username: str, action: str, category: str = "general", commit: bool = True):
     entry = Notification(
         user=username or "Unknown",
         action=action,
@@ -378,7 +944,8 @@ async def log_activity(db: AsyncSession, username: str, action: str, category: s
         timestamp=datetime.now(),
     )
     db.add(entry)
-    await db.commit()
+    if commit:
+        await db.commit()
 
 def get_username_from_request(request: Optional[Request]) -> str:
     if not request:
@@ -500,9 +1067,7 @@ async def create_council(data: Dict, request: Request, db: AsyncSession = Depend
     if existing.scalar_one_or_none():
         raise HTTPException(status_code=409, detail="Council already exists")
 
-    # compute new id like your JSON increment
-    res = await db.execute(select(func.coalesce(func.max(Council.id), 0)))
-    new_id = (res.scalar_one() or 0) + 1
+    new_id = await next_council_id(db)
 
     item = Council(
         id=new_id,
@@ -595,31 +1160,35 @@ def _format_address_parts(house_no: Optional[str], street: Optional[str],
     return ", ".join(parts)
 
 
-async def _get_latest_address(db: AsyncSession, client_id: str) -> Optional[ClientAddress]:
-    res = await db.execute(
-        select(ClientAddress)
-        .where(ClientAddress.client_id == client_id)
-        .order_by(ClientAddress.created_at.desc())
+def _latest_per_client(model):
+    # LATERAL "newest row per client" subquery; served by the (client_id, created_at) index
+    sq = (
+        select(model)
+        .where(model.client_id == Client.id)
+        .order_by(model.created_at.desc())
         .limit(1)
+        .lateral()
     )
-    return res.scalars().first()
+    return sq, aliased(model, sq)
 
 
-async def _get_latest_kin(db: AsyncSession, client_id: str) -> Optional[ClientKin]:
-    res = await db.execute(
-        select(ClientKin)
-        .where(ClientKin.client_id == client_id)
-        .order_by(ClientKin.created_at.desc())
-        .limit(1)
+def _client_json_query():
+    """
+    One round trip per page of clients: council name plus latest address
+    and latest kin are resolved in the same statement.
+    """
+    addr_sq, LatestAddr = _latest_per_client(ClientAddress)
+    kin_sq, LatestKin = _latest_per_client(ClientKin)
+    return (
+        select(Client, Council.name, LatestAddr, LatestKin)
+        .outerjoin(Council, Council.id == Client.councilId)
+        .outerjoin(addr_sq, true())
+        .outerjoin(kin_sq, true())
     )
-    return res.scalars().first()
-
 
-async def _client_to_json(db: AsyncSession, c: Client) -> Dict:
-    council = await db.get(Council, c.councilId) if c.councilId else None
-    addr = await _get_latest_address(db, c.id)
-    kin = await _get_latest_kin(db, c.id)
 
+def _client_to_json(c: Client, council_name: Optional[str],
+                    addr: Optional[ClientAddress], kin: Optional[ClientKin]) -> Dict:
     address_str = _format_address_parts(
         getattr(addr, "house_no", None),
         getattr(addr, "street", None),
@@ -659,29 +1228,207 @@ async def _client_to_json(db: AsyncSession, c: Client) -> Dict:
         "status": c.status,
         "optional_fields": c.optional_fields or [],
         "profileImg": c.profileImg or "../images/profile.png",
-        "council": (council.name if council else "Unknown"),
+        "council": (council_name if c.councilId and council_name else "Unknown"),
         "created_by": c.created_by,
     }
 
+
+async def _clients_json(db: AsyncSession, q=None) -> List[Dict]:
+    res = await db.execute(q if q is not None else _client_json_query())
+    return [_client_to_json(c, council_name, addr, kin) for c, council_name, addr, kin in res.all()]
+
+
+async def _client_json_by_id(db: AsyncSession, client_id: str) -> Optional[Dict]:
+    rows = await _clients_json(db, _client_json_query().where(Client.id == client_id))
+    return rows[0] if rows else None
+
 # -------------------------------------------------------------------
 # CLIENT ROUTES
 # -------------------------------------------------------------------
+CLIENT_PAGE_MAX = 500
+
+# sort name -> key expression; Client.id is always the keyset tie-breaker.
+# Every key is text, so a client cursor is always [str, str] (checked in get_clients)
+CLIENT_SORT_KEYS = {
+    # literal '' / ' ' (not bind params) so the expression matches ix_clients_name_id
+    "name": lambda: func.lower(
+        func.coalesce(Client.first_name, literal_column("''")).op("||")(literal_column("' '"))
+        .op("||")(func.coalesce(Client.last_name, literal_column("''")))
+    ),
+    "id": lambda: Client.id,
+    "council": lambda: func.lower(func.coalesce(Council.name, literal_column("''"))),
+}
+
+def _encode_cursor(values: List) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> List:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def _client_filters(council: Optional[int], status: Optional[str], created_by: Optional[str]) -> List:
+    conds = []
+    if council is not None:
+        conds.append(Client.councilId == council)
+    if status:
+        conds.append(func.lower(Client.status) == status.strip().lower())
+    if created_by:
+        conds.append(func.lower(Client.created_by) == created_by.strip().lower())
+    return conds
+
 @api.get("/clients")
-async def get_clients(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Client))
-    rows = res.scalars().all()
-    out = []
-    for c in rows:
-        out.append(await _client_to_json(db, c))
+async def get_clients(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: str = "name",
+    council: Optional[int] = None,
+    status: Optional[str] = None,
+    created_by: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Without `limit` the full client list is returned (legacy shape).
+    With `limit`, a keyset page is returned:
+      {"items": [...], "total": N, "next_cursor": "..." | null}
+    Pass `next_cursor` back as `cursor` (with the same sort/filters) for the next page.
+    """
+    conds = _client_filters(council, status, created_by)
+    if limit is None and not cursor:
+        q = _client_json_query()
+        if conds:
+            q = q.where(*conds)
+        return await _clients_json(db, q)
+
+    if sort not in CLIENT_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort '{sort}' (use name, id or council)")
+    limit = max(1, min(limit or 100, CLIENT_PAGE_MAX))
+    sort_key = CLIENT_SORT_KEYS[sort]()
+
+    count_q = select(func.count()).select_from(Client)
+    if conds:
+        count_q = count_q.where(*conds)
+    total = (await db.execute(count_q)).scalar_one()
+
+    q = _client_json_query().add_columns(sort_key)
+    if conds:
+        q = q.where(*conds)
+    if cursor:
+        values = _decode_cursor(cursor)
+        # a stale or hand-made cursor must not reach asyncpg with the wrong types
+        if len(values) != 2 or not all(isinstance(v, str) for v in values):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        last_key, last_id = values
+        q = q.where(tuple_(sort_key, Client.id) > tuple_(last_key, last_id))
+    q = q.order_by(sort_key, Client.id).limit(limit + 1)
+
+    res = await db.execute(q)
+    rows = res.all()
+    page = rows[:limit]
+    items = [_client_to_json(c, council_name, addr, kin) for c, council_name, addr, kin, _ in page]
+
+    next_cursor = None
+    if len(rows) > limit and page:
+        last = page[-1]
+        next_cursor = _encode_cursor([last[4], last[0].id])
+
+    return {"items": items, "total": total, "next_cursor": next_cursor}
+
+
+CLIENT_SEARCH_MAX = 50
+
+def _concat(*parts):
+    out = parts[0]
+    for p in parts[1:]:
+        out = out.op("||")(p)
     return out
 
+def _client_search_doc():
+    # same expression as ix_clients_search_trgm (literals, not bind params, so the index matches)
+    blank, sep = literal_column("''"), literal_column("' '")
+    phone_digits = func.regexp_replace(
+        func.coalesce(Client.phone, blank), literal_column("'[^0-9]'"), blank, literal_column("'g'")
+    )
+    return func.lower(_concat(
+        func.coalesce(Client.first_name, blank), sep,
+        func.coalesce(Client.last_name, blank), sep,
+        Client.id, sep,
+        func.coalesce(Client.email, blank), sep,
+        phone_digits,
+    ))
+
+def _postcode_search_key():
+    # same expression as ix_client_address_postcode_trgm
+    return func.lower(func.replace(
+        func.coalesce(ClientAddress.postcode, literal_column("''")), literal_column("' '"), literal_column("''")
+    ))
+
+def _search_match(expr, term: str):
+    if TRGM_AVAILABLE:
+        return expr.op("%>")(term) | expr.contains(term, autoescape=True)
+    return expr.contains(term, autoescape=True)
+
+def _search_score(expr, term: str):
+    if TRGM_AVAILABLE:
+        return func.word_similarity(term, expr)
+    return case((expr.startswith(term, autoescape=True), 1.0), else_=0.5)
+
+def _client_search_query(term: str, limit: int):
+    """
+    (client_id, score) for the `limit` best matches of an already stripped + lowercased term,
+    best first. Shared by the search box and anything that must list the same clients.
+    """
+    # "07700 900-123" should hit the digits-only phone in the search document
+    if re.fullmatch(r"[\d\s()+-]+", term):
+        term = re.sub(r"\D", "", term) or term
+    pc_term = term.replace(" ", "")
+
+    doc = _client_search_doc()
+    pc = _postcode_search_key()
+    hits = union_all(
+        select(Client.id.label("client_id"), _search_score(doc, term).label("score"))
+        .where(_search_match(doc, term)),
+        select(ClientAddress.client_id.label("client_id"), _search_score(pc, pc_term).label("score"))
+        .where(ClientAddress.is_current == True, _search_match(pc, pc_term)),
+    ).subquery()
+    best = func.max(hits.c.score)
+    return (
+        select(hits.c.client_id, best.label("score"))
+        .group_by(hits.c.client_id)
+        .order_by(best.desc(), hits.c.client_id)
+        .limit(limit)
+    )
+
+@api.get("/clients/search")
+async def search_clients(q: str = "", limit: int = 20, db: AsyncSession = Depends(get_db)):
+    """
+    Ranked client lookup by partial name, client ID, email, phone or current postcode.
+    Returns {"items": [...]} (best match first), same client JSON as /clients.
+    """
+    term = (q or "").strip().lower()
+    if not term:
+        return {"items": []}
+    limit = max(1, min(limit, CLIENT_SEARCH_MAX))
+
+    res = await db.execute(_client_search_query(term, limit))
+    ranked = [cid for cid, _ in res.all()]
+    if not ranked:
+        return {"items": []}
+
+    by_id = {c["id"]: c for c in await _clients_json(db, _client_json_query().where(Client.id.in_(ranked)))}
+    return {"items": [by_id[cid] for cid in ranked if cid in by_id]}
+
 
 @api.get("/clients/{client_id}")
 async def get_client_by_id(client_id: str, db: AsyncSession = Depends(get_db)):
-    c = await db.get(Client, client_id)
-    if not c:
+    out = await _client_json_by_id(db, client_id)
+    if not out:
         raise HTTPException(status_code=404, detail="Client not found")
-    return await _client_to_json(db, c)
+    return out
 
 
 # ========= Addresses (All) =========
@@ -958,16 +1705,13 @@ async def add_client_kin(client_id: str, data: dict, request: Request, db: Async
 async def add_client(data: Dict, request: Request, db: AsyncSession = Depends(get_db)):
     cid = data.get("id")
     if not cid:
-        res = await db.execute(select(Client.id))
-        ids = res.scalars().all()
-        numeric = [int(x) for x in ids if x.isdigit()]
-        next_id = (max(numeric) + 1) if numeric else 1
-        cid = f"{next_id:010d}"
+        cid = await next_client_id(db)
         data["id"] = cid
     else:
         exists = await db.get(Client, cid)
         if exists:
             raise HTTPException(status_code=400, detail="Client ID already exists")
+        await bump_client_id_seq(db, cid)
 
     username = get_username_from_request(request)
 
@@ -991,7 +1735,11 @@ async def add_client(data: Dict, request: Request, db: AsyncSession = Depends(ge
         created_by=username,
     )
     db.add(c)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Client ID already exists")
 
     # initial address
     addr_house = (data.get("address_house_number") or "").strip()
@@ -1049,7 +1797,7 @@ async def add_client(data: Dict, request: Request, db: AsyncSession = Depends(ge
         "client",
     )
 
-    client_json = await _client_to_json(db, c)
+    client_json = await _client_json_by_id(db, cid)
     return {"message": "Client added successfully", "client": client_json}
 
 
@@ -1086,7 +1834,7 @@ async def update_client(client_id: str, data: Dict, request: Request, db: AsyncS
     await db.commit()
     await log_activity(db, get_username_from_request(request), f"Client '{client_id}' updated", "client")
 
-    merged = await _client_to_json(db, c)
+    merged = await _client_json_by_id(db, client_id)
     return {"message": "Client updated successfully", "client": merged}
 
 
@@ -1319,7 +2067,7 @@ def generate_one_time_entries_raw(service: Dict, entered_by="System"):
     setup_name = service.get("setupFee") or ""
     out = []
 
-    def push(desc, debit):
+    def push(desc, debit, kind):
         if debit and float(debit) > 0:
             out.append({
                 "date": start_str,  # This will now be 01/MM/YYYY instead of the exact start date
@@ -1327,15 +2075,16 @@ def generate_one_time_entries_raw(service: Dict, entered_by="System"):
                 "credit": 0.0,
                 "debit": float(debit),
                 "enteredBy": entered_by,
+                "kind": kind,
             })
 
     if service.get("initialFee"):
-        push(f"{setup_name}", service["initialFee"])
+        push(f"{setup_name}", service["initialFee"], "initial")
 
     if "Payroll" in (setup_name or ""):
-        if service.get("pensionSetup"): push("Pension Setup Fee", service["pensionSetup"])
-        if service.get("pensionFee"):   push(f"Annual Pension Fee {start_year}-{end_year}", service["pensionFee"])
-        if service.get("yearEndFee"):   push(f"Annual Year End Fee {start_year}-{end_year}", service["yearEndFee"])
+        if service.get("pensionSetup"): push("Pension Setup Fee", service["pensionSetup"], "pension_setup")
+        if service.get("pensionFee"):   push(f"Annual Pension Fee {start_year}-{end_year}", service["pensionFee"], "pension")
+        if service.get("yearEndFee"):   push(f"Annual Year End Fee {start_year}-{end_year}", service["yearEndFee"], "year_end")
     return out
 
 def generate_monthly_entries_to_now_raw(service: Dict, entered_by="System"):
@@ -1352,9 +2101,32 @@ def generate_monthly_entries_to_now_raw(service: Dict, entered_by="System"):
             "credit": 0.0,
             "debit": mf,
             "enteredBy": entered_by,
+            "kind": "monthly",
         })
     return out
 
+def fee_kind_for_description(desc: str) -> Optional[str]:
+    # system fee kinds recognisable from text; monthly fees stay unkeyed and are
+    # matched by text in MONTHLY_DEBITS_SQL
+    d = (desc or "").strip().lower()
+    if d.startswith("pension setup fee"):
+        return "pension_setup"
+    if d.startswith("annual pension fee"):
+        return "pension"
+    if d.startswith("annual year end fee"):
+        return "year_end"
+    return None
+
+def statement_insert(rows: List[Dict]):
+    """
+    Multi-row INSERT into yi.statements; rows carrying a fee key (kind, period)
+    that already exists are skipped by ux_statements_fee_key.
+    """
+    return pg_insert(Statement).values(rows).on_conflict_do_nothing(
+        index_elements=[Statement.serviceId, Statement.kind, Statement.period],
+        index_where=Statement.kind.isnot(None),
+    )
+
 @api.post("/services")
 async def add_service(data: Dict, request: Request, db: AsyncSession = Depends(get_db)):
     client_id = data.get("clientId")
@@ -1371,20 +2143,7 @@ async def add_service(data: Dict, request: Request, db: AsyncSession = Depends(g
 
     await validate_reference(db, client_id=client_id, category=referred_by, reference=client_reference)
 
-    # determine sequence number for serviceId
-    res = await db.execute(select(Service.serviceId).where(Service.clientId == client_id))
-    existing_ids = [r for (r,) in res.all()] if hasattr(res, "all") else res.scalars().all()
-    seq = 1
-    if existing_ids:
-        # find max suffix ####
-        suffixes = []
-        for sid in existing_ids:
-            try:
-                suffixes.append(int(sid.split("-")[-1]))
-            except Exception:
-                pass
-        seq = (max(suffixes) + 1) if suffixes else (len(existing_ids) + 1)
-    new_service_id = f"SV-{client_id}-{seq:04d}"
+    new_service_id = await next_service_id(db, client_id)
 
     svc = Service(
         serviceId=new_service_id,
@@ -1437,17 +2196,24 @@ async def add_service(data: Dict, request: Request, db: AsyncSession = Depends(g
     initial_rows = generate_one_time_entries_raw(seed_dict, "System") + generate_monthly_entries_to_now_raw(seed_dict, "System")
 
     if initial_rows:
+        now = datetime.utcnow()
+        values = []
         for s in initial_rows:
-            stmt = Statement(
-                id=str(uuid.uuid4()),
-                serviceId=svc.serviceId,
-                date=_parse_date_any(s.get("date")),
-                description=s.get("description") or "",
-                credit=float(s.get("credit") or 0),
-                debit=float(s.get("debit") or 0),
-                enteredBy="System",
-            )
-            db.add(stmt)
+            d = _parse_date_any(s.get("date"))
+            kind = s.get("kind") if d else None
+            values.append({
+                "id": str(uuid.uuid4()),
+                "serviceId": svc.serviceId,
+                "date": d,
+                "description": s.get("description") or "",
+                "credit": float(s.get("credit") or 0),
+                "debit": float(s.get("debit") or 0),
+                "enteredBy": "System",
+                "created_at": now,
+                "kind": kind,
+                "period": first_day_of_month(d) if kind else None,
+            })
+        await db.execute(statement_insert(values))
         await db.commit()
 
     await log_activity(db, get_username_from_request(request), f"Service '{svc.serviceId}' added for client {svc.clientId}", "service")
@@ -1491,6 +2257,9 @@ async def update_service(service_id: str, data: Dict, request: Request, db: Asyn
         svc.endDate = _to_date_or_none(data.get("endDate"))
 
     await db.commit()
+    # the scheduler only walks forward from its watermark; catch up this service now
+    if any(k in data for k in ("monthlyFee", "startDate", "endDate")):
+        await ensure_monthly_debits(db, service_id=service_id)
     await log_activity(db, get_username_from_request(request), f"Service '{service_id}' updated", "service")
     return {"message": "Service updated", "service": _service_to_json(svc)}
 
@@ -1687,46 +2456,50 @@ def first_day_of_month(d: date) -> date:
 def last_day_of_month(d: date) -> date:
     return date(d.year, d.month, calendar.monthrange(d.year, d.month)[1])
 
-def month_bounds_for(service: Dict, context_d: date):
-    svc_start = get_service_start_date_dict(service)
-    month_start = first_day_of_month(context_d)
-    month_end   = last_day_of_month(context_d)
-    if svc_start.year == context_d.year and svc_start.month == context_d.month:
-        window_start = max(svc_start, month_start)
-    else:
-        window_start = month_start
-    return (window_start, month_end)
-
-async def check_and_log_budget_exceed(db: AsyncSession, service_id: str, triggered_by: str, context_date_str: Optional[str] = None):
-    svc = await db.get(Service, service_id)
-    if not svc:
-        return
-    budget = float(svc.setupBudget or 0)
-    if budget <= 0:
-        return
+# (alert flag, Service budget column, monthly multiplier, label); carer/agency budgets are weekly
+BUDGET_CHECKS = (
+    ("setup_exceeded", "setupBudget", 1, "setup budget"),
+    ("carer_exceeded", "carerBudget", 4, "carer budget"),
+    ("agency_exceeded", "agencyBudget", 4, "agency budget"),
+)
 
+async def check_and_log_budget_exceed(db: AsyncSession, service_id: str, triggered_by: str, context_date_str: Optional[str] = None, commit: bool = True):
+    """Compare the month's rolled-up debits with each budget; log only on the transition into exceeded."""
     ctx_d = _parse_date_any(context_date_str) if context_date_str else date.today()
     if not ctx_d:
         ctx_d = date.today()
-    window_start, window_end = month_bounds_for({
-        "startDate": svc.startDate.strftime("%Y-%m-%d") if svc.startDate else None,
-        "setupFee": svc.setupFee
-    }, ctx_d)
-
-    res = await db.execute(select(Statement).where(Statement.serviceId == service_id))
-    stmts = res.scalars().all()
-    total_debit = 0.0
-    for s in stmts:
-        sd = s.date
-        if not sd:
+    month = first_day_of_month(ctx_d)
+
+    # row lock serialises concurrent checks so each transition is logged once
+    row = (await db.execute(
+        select(ServiceMonthSpend, *(getattr(Service, col) for _, col, _, _ in BUDGET_CHECKS))
+        .join(Service, Service.serviceId == ServiceMonthSpend.service_id)
+        .where(ServiceMonthSpend.service_id == service_id, ServiceMonthSpend.month == month)
+        .with_for_update(of=ServiceMonthSpend)
+        .execution_options(populate_existing=True)  # totals are written by trigger, not the ORM
+    )).first()
+    if not row:
+        return
+    spend, budgets = row[0], row[1:]
+    total_debit = float(spend.debit or 0)
+    month_tag = f"{month.year:04d}-{month.month:02d}"
+
+    for (flag, _, mult, label), budget in zip(BUDGET_CHECKS, budgets):
+        limit = float(budget or 0) * mult
+        exceeded = limit > 0 and total_debit > limit
+        if exceeded == getattr(spend, flag):
             continue
-        if window_start <= sd <= window_end:
-            total_debit += float(s.debit or 0)
-
-    if total_debit > budget:
-        month_tag = f"{ctx_d.year:04d}-{ctx_d.month:02d}"
-        msg = f"Monthly expenses for service {service_id} exceeded setup budget for {month_tag} (£{total_debit:.2f} > £{budget:.2f})"
-        await log_activity(db, triggered_by or "System", msg, "budget")
+        setattr(spend, flag, exceeded)
+        if exceeded:
+            db.add(Notification(
+                user=triggered_by or "System",
+                action=f"Monthly expenses for service {service_id} exceeded {label} for {month_tag} "
+                       f"(£{total_debit:.2f} > £{limit:.2f})",
+                category="budget",
+                timestamp=datetime.now(),
+            ))
+    if commit:
+        await db.commit()
 
 def parse_date_for_pdf(s: Optional[str]) -> str:
     if not s:
@@ -1737,37 +2510,236 @@ def parse_date_for_pdf(s: Optional[str]) -> str:
 # -------------------------------------------------------------------
 # STATEMENTS
 # -------------------------------------------------------------------
+STATEMENT_PAGE_MAX = 1000
+
+def _ledger_sort_keys():
+    # same expressions as ix_statements_ledger; undated rows sort last, as before
+    return (
+        func.coalesce(Statement.date, literal_column("'infinity'::date")),
+        func.coalesce(Statement.created_at, literal_column("'-infinity'::timestamp")),
+        Statement.id,
+    )
+
+def _statement_to_json(s: Statement) -> Dict:
+    return {
+        "id": s.id,
+        "date": s.date.strftime("%Y-%m-%d") if s.date else "",
+        "description": s.description or "",
+        "credit": float(s.credit or 0),
+        "debit": float(s.debit or 0),
+        "enteredBy": s.enteredBy or "System"
+    }
+
+def _parse_range_date(value: Optional[str], name: str) -> Optional[date]:
+    # a bad bound is an error, never "no bound": that would quietly export the whole ledger
+    if not value:
+        return None
+    d = _parse_date_any(value)
+    if not d:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' date")
+    return d
+
+def _parse_date_range(start: Optional[str], end: Optional[str],
+                      start_name: str = "start", end_name: str = "end") -> tuple:
+    # an inverted range is as wrong as a malformed bound: it would export an empty file
+    start_d, end_d = _parse_range_date(start, start_name), _parse_range_date(end, end_name)
+    if start_d and end_d and start_d > end_d:
+        raise HTTPException(status_code=400, detail=f"'{start_name}' date is after '{end_name}' date")
+    return start_d, end_d
+
+async def _ledger_net(db: AsyncSession, service_id: str, *conds) -> float:
+    # sum(credit - debit) over one service's rows matching conds (index-only on ix_statements_ledger)
+    res = await db.execute(
+        select(func.coalesce(func.sum(
+            func.coalesce(Statement.credit, 0) - func.coalesce(Statement.debit, 0)), 0))
+        .where(Statement.serviceId == service_id, *conds)
+    )
+    return float(res.scalar_one())
+
+async def ledger_balance_before(db: AsyncSession, service_id: str, d: date) -> float:
+    """Balance of every dated row before `d`: last month's closing snapshot plus this month's rows."""
+    month = first_day_of_month(d)
+    res = await db.execute(
+        select(ServiceMonthSpend.closing_balance)
+        .where(ServiceMonthSpend.service_id == service_id, ServiceMonthSpend.month < month)
+        .order_by(ServiceMonthSpend.month.desc())
+        .limit(1)
+    )
+    closing = float(res.scalar() or 0)
+    key_date = _ledger_sort_keys()[0]
+    return closing + await _ledger_net(db, service_id, key_date >= month, key_date < d)
+
+async def ledger_balance(db: AsyncSession, service_id: str) -> float:
+    """Whole-ledger balance: latest closing snapshot plus any undated rows."""
+    key_date = _ledger_sort_keys()[0]
+    return await ledger_balance_before(db, service_id, date.max) + await _ledger_net(
+        db, service_id, key_date == literal_column("'infinity'::date")
+    )
+
+async def ledger_openings(db: AsyncSession, service_ids: List[str], d: date) -> Dict[str, float]:
+    """ledger_balance_before for many services at once: one snapshot query and one aggregate."""
+    if not service_ids:
+        return {}
+    month = first_day_of_month(d)
+    res = await db.execute(
+        select(ServiceMonthSpend.service_id, ServiceMonthSpend.closing_balance)
+        .where(ServiceMonthSpend.service_id.in_(service_ids), ServiceMonthSpend.month < month)
+        .distinct(ServiceMonthSpend.service_id)
+        .order_by(ServiceMonthSpend.service_id, ServiceMonthSpend.month.desc())
+    )
+    out = {sid: float(v or 0) for sid, v in res.all()}
+    if d > month:
+        key_date = _ledger_sort_keys()[0]
+        res = await db.execute(
+            select(Statement.serviceId,
+                   func.sum(func.coalesce(Statement.credit, 0) - func.coalesce(Statement.debit, 0)))
+            .where(Statement.serviceId.in_(service_ids), key_date >= month, key_date < d)
+            .group_by(Statement.serviceId)
+        )
+        for sid, net in res.all():
+            out[sid] = out.get(sid, 0.0) + float(net or 0)
+    return out
+
+async def ledger_balances(db: AsyncSession, service_ids: List[str]) -> Dict[str, float]:
+    """ledger_balance for many services at once."""
+    out = await ledger_openings(db, service_ids, date.max)
+    if service_ids:
+        key_date = _ledger_sort_keys()[0]
+        res = await db.execute(
+            select(Statement.serviceId,
+                   func.sum(func.coalesce(Statement.credit, 0) - func.coalesce(Statement.debit, 0)))
+            .where(Statement.serviceId.in_(service_ids), key_date == literal_column("'infinity'::date"))
+            .group_by(Statement.serviceId)
+        )
+        for sid, net in res.all():
+            out[sid] = out.get(sid, 0.0) + float(net or 0)
+    return out
+
+async def _statements_json(db: AsyncSession, service_id: str) -> List[Dict]:
+    res = await db.execute(
+        select(Statement).where(Statement.serviceId == service_id).order_by(*_ledger_sort_keys())
+    )
+    return [_statement_to_json(s) for s in res.scalars().all()]
+
 @api.get("/services/{service_id}/statements")
-async def get_statements(service_id: str, db: AsyncSession = Depends(get_db)):
+async def get_statements(
+    service_id: str,
+    db: AsyncSession = Depends(get_db),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+):
+    """
+    Without paging params the full ledger is returned (legacy list, oldest first).
+    With `limit`, `cursor`, `from` or `to`, a keyset page is returned:
+      {"items": [...], "opening_balance": B, "next_cursor": "..." | null}
+    `opening_balance` is the ledger balance just before the page's first row; each item
+    carries its running `balance`. Pass `next_cursor` back as `cursor` (same from/to).
+    """
     svc = await db.get(Service, service_id)
     if not svc:
         raise HTTPException(status_code=404, detail="Service not found")
 
-    res = await db.execute(select(Statement).where(Statement.serviceId == service_id))
-    stmts = res.scalars().all()
+    if limit is None and not cursor and not from_ and not to:
+        return await _statements_json(db, service_id)
 
-    # Ensure order by (date, FIFO per insert order) in response
-    indexed = list(enumerate(stmts))
-    indexed.sort(key=lambda item: (item[1].date or date.max, item[0]))
-    out = []
-    for _, s in indexed:
-        out.append({
-            "id": s.id,
-            "date": s.date.strftime("%Y-%m-%d") if s.date else "",
-            "description": s.description or "",
-            "credit": float(s.credit or 0),
-            "debit": float(s.debit or 0),
-            "enteredBy": s.enteredBy or "System"
-        })
-    return out
+    key_date, key_created, _ = sort_keys = _ledger_sort_keys()
+
+    from_d, to_d = _parse_date_range(from_, to, "from", "to")
+    limit = max(1, min(limit or 200, STATEMENT_PAGE_MAX))
+
+    conds = [Statement.serviceId == service_id]
+    opening = 0.0  # ledger balance just before the page's first row
+    if cursor:
+        values = _decode_cursor(cursor)
+        try:
+            last = (date.fromisoformat(values[0]), datetime.fromisoformat(values[1]), str(values[2]))
+        except (IndexError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        conds.append(tuple_(*sort_keys) > tuple_(*last))
+        # snapshot up to the cursor's date, plus the rows on that date up to the cursor
+        opening = await ledger_balance_before(db, service_id, last[0]) + await _ledger_net(
+            db, service_id, key_date == last[0], tuple_(*sort_keys) <= tuple_(*last)
+        )
+    elif from_d:
+        opening = await ledger_balance_before(db, service_id, from_d)
+    if from_d:
+        conds.append(key_date >= from_d)
+    if to_d:
+        conds.append(key_date <= to_d)
+
+    res = await db.execute(
+        select(Statement, key_date, key_created).where(*conds).order_by(*sort_keys).limit(limit + 1)
+    )
+    rows = res.all()
+    page = rows[:limit]
+
+    items, balance = [], opening
+    for s, _, _ in page:
+        item = _statement_to_json(s)
+        balance += item["credit"] - item["debit"]
+        item["balance"] = round(balance, 2)
+        items.append(item)
+
+    next_cursor = None
+    if len(rows) > limit and page:
+        s, d, created = page[-1]
+        next_cursor = _encode_cursor([d.isoformat(), created.isoformat(), s.id])
+
+    return {"items": items, "opening_balance": round(opening, 2), "next_cursor": next_cursor}
+
+@api.get("/services/{service_id}/balance")
+async def get_service_balance(service_id: str, as_of: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Ledger balance at the end of `as_of` (default: the whole ledger)."""
+    svc = await db.get(Service, service_id)
+    if not svc:
+        raise HTTPException(status_code=404, detail="Service not found")
+    as_of_d = _parse_range_date(as_of, "as_of")
+    if as_of_d:
+        balance = await ledger_balance_before(db, service_id, as_of_d + timedelta(days=1))
+    else:
+        balance = await ledger_balance(db, service_id)
+    return {
+        "serviceId": service_id,
+        "as_of": as_of_d.strftime("%Y-%m-%d") if as_of_d else None,
+        "balance": round(balance, 2),
+    }
+
+async def _ledger_summary(db: AsyncSession, service_id: str) -> Dict:
+    # totals from the monthly rollup plus any undated rows (not rolled up)
+    key_date = _ledger_sort_keys()[0]
+    rolled = (await db.execute(
+        select(func.coalesce(func.sum(ServiceMonthSpend.credit), 0), func.coalesce(func.sum(ServiceMonthSpend.debit), 0))
+        .where(ServiceMonthSpend.service_id == service_id)
+    )).one()
+    undated = (await db.execute(
+        select(func.coalesce(func.sum(Statement.credit), 0), func.coalesce(func.sum(Statement.debit), 0))
+        .where(Statement.serviceId == service_id, key_date == literal_column("'infinity'::date"))
+    )).one()
+    credit = float(rolled[0]) + float(undated[0])
+    debit = float(rolled[1]) + float(undated[1])
+    return {
+        "totals": {"credit": round(credit, 2), "debit": round(debit, 2)},
+        "balance": round(credit - debit, 2),
+    }
+
+async def _statement_mutation_response(db: AsyncSession, service_id: str, full: bool, body: Dict) -> Dict:
+    # lean by default: the changed row plus totals/balance; `full` adds the whole ledger
+    body.update(await _ledger_summary(db, service_id))
+    if full:
+        body["statements"] = await _statements_json(db, service_id)
+    return body
 
 @api.post("/services/{service_id}/statements")
 async def add_statement(
     service_id: str,
     stmt: Dict,
     request: Request,
+    full: bool = False,
     db: AsyncSession = Depends(get_db)
 ):
+    """Add one statement. Pass `full=true` to also get the whole ledger back."""
     # ✅ Ensure service exists
     svc = await db.get(Service, service_id)
     if not svc:
@@ -1796,28 +2768,32 @@ async def add_statement(
         created_at=datetime.utcnow(),
     )
 
+    # ✅ Row, activity log and budget check commit together
     db.add(new_stmt)
-    await db.commit()
-    await db.refresh(new_stmt)
-
-    # ✅ Log and check budget after commit
+    try:
+        await db.flush()
+    except IntegrityError:
+        # an identical row committed between the trigger's check and ours (e.g. a double submit)
+        # takes the ux_statements_content key, or the client reused a statement id
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Duplicate statement: an identical entry was just saved")
     await log_activity(
         db,
         username,
         f"Statement added in service '{service_id}' by {username}",
-        "statement"
+        "statement",
+        commit=False,
     )
+    await check_and_log_budget_exceed(db, service_id, username, stmt.get("date"), commit=False)
 
-    await check_and_log_budget_exceed(db, service_id, username, stmt.get("date"))
-
-    # ✅ Return all statements for that service
-    result = await db.execute(select(Statement).where(Statement.serviceId == service_id))
-    statements = result.scalars().all()
-
-    return {"message": "Statement added", "statements": statements}
+    out = await _statement_mutation_response(
+        db, service_id, full, {"message": "Statement added", "statement": _statement_to_json(new_stmt)}
+    )
+    await db.commit()
+    return out
 
 @api.put("/services/{service_id}/statements/{stmt_id}")
-async def update_statement_by_id(service_id: str, stmt_id: str, data: Dict, request: Request, db: AsyncSession = Depends(get_db)):
+async def update_statement_by_id(service_id: str, stmt_id: str, data: Dict, request: Request, full: bool = False, db: AsyncSession = Depends(get_db)):
     svc = await db.get(Service, service_id)
     if not svc:
         raise HTTPException(status_code=404, detail="Service not found")
@@ -1833,6 +2809,8 @@ async def update_statement_by_id(service_id: str, stmt_id: str, data: Dict, requ
         if stmt_d and stmt_d < start_d:
             raise HTTPException(status_code=400, detail="Statement date before service start date")
 
+    old_date = st.date
+
     # update
     for k in ("description", "enteredBy"):
         if k in data:
@@ -1844,210 +2822,314 @@ async def update_statement_by_id(service_id: str, stmt_id: str, data: Dict, requ
     if "debit" in data:
         st.debit = float(data.get("debit") or 0)
 
+    await db.flush()
+    await log_activity(db, get_username_from_request(request), f"Statement '{stmt_id}' updated in service '{service_id}'", "statement", commit=False)
+    # re-check the month the row moved out of as well as the one it now sits in
+    for d in {old_date, st.date}:
+        if d:
+            await check_and_log_budget_exceed(db, service_id, "System", d.isoformat(), commit=False)
+
+    out = await _statement_mutation_response(
+        db, service_id, full, {"message": "Statement updated", "statement": _statement_to_json(st)}
+    )
     await db.commit()
-    await log_activity(db, get_username_from_request(request), f"Statement '{stmt_id}' updated in service '{service_id}'", "statement")
-    await check_and_log_budget_exceed(db, service_id, "System", data.get("date"))
-    return {"message": "Statement updated", "statement": {
-        "id": st.id, "date": st.date.strftime("%Y-%m-%d") if st.date else "", "description": st.description or "",
-        "credit": float(st.credit or 0), "debit": float(st.debit or 0), "enteredBy": st.enteredBy or "System"
-    }, "statements": await get_statements(service_id, db)}
+    return out
 
 @api.delete("/services/{service_id}/statements/{stmt_id}")
-async def delete_statement_by_id(service_id: str, stmt_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+async def delete_statement_by_id(service_id: str, stmt_id: str, request: Request, full: bool = False, db: AsyncSession = Depends(get_db)):
     st = await db.get(Statement, stmt_id)
     if not st or st.serviceId != service_id:
         raise HTTPException(status_code=404, detail="Statement not found")
+    stmt_d = st.date
     await db.delete(st)
+    await db.flush()
+    await log_activity(db, get_username_from_request(request), f"Statement '{stmt_id}' deleted in service '{service_id}'", "statement", commit=False)
+    if stmt_d:
+        await check_and_log_budget_exceed(db, service_id, "System", stmt_d.isoformat(), commit=False)
+
+    out = await _statement_mutation_response(
+        db, service_id, full, {"message": "Statement deleted successfully", "deleted": stmt_id}
+    )
     await db.commit()
-    await log_activity(db, get_username_from_request(request), f"Statement '{stmt_id}' deleted in service '{service_id}'", "statement")
-    await check_and_log_budget_exceed(db, service_id, "System")
-    return {"message": "Statement deleted successfully", "statements": await get_statements(service_id, db)}
+    return out
 
 # -------------------------------------------------------------------
 # BULK STATEMENT UPLOAD (CSV)
 # -------------------------------------------------------------------
-@api.post("/services/statements/upload-csv")
-async def upload_statements_csv(
-    file: UploadFile = File(...),
-    request: Request = None,
-    db: AsyncSession = Depends(get_db),
-):
+UPLOAD_INSERT_BATCH = 1000  # rows per chunk: parsed off the event loop, then one INSERT
+UPLOAD_MAX_ROW_ERRORS = 1000  # row_errors kept for the response; any beyond are only counted
+UPLOAD_REQUIRED_COLUMNS = ["serviceid", "date", "description", "credit", "debit"]
+
+# one chunk of CSV rows as parallel arrays: a fixed-shape statement (prepared once, no per-row
+# bind params). ON CONFLICT DO NOTHING covers ux_statements_content (duplicates already stored or
+# earlier in the file) and ux_statements_fee_key (system fees that already exist).
+STATEMENT_IMPORT_SQL = text("""
+    INSERT INTO yi.statements (id, "serviceId", date, description, credit, debit, "enteredBy", created_at,
+                               kind, period, content_hash)
+    SELECT u.id, u.sid, u.d, u.descr, u.cr, u.db, :entered_by, :created_at, u.kind, u.period,
+           yi.statement_content_hash(u.d, u.descr, u.cr, u.db)
+    FROM unnest(CAST(:ids AS text[]), CAST(:sids AS text[]), CAST(:dates AS date[]), CAST(:descs AS text[]),
+                CAST(:credits AS numeric[]), CAST(:debits AS numeric[]), CAST(:kinds AS text[]),
+                CAST(:periods AS date[])) AS u(id, sid, d, descr, cr, db, kind, period)
+    ON CONFLICT DO NOTHING
+    RETURNING id
+""")
+
+UPLOAD_MAX_RATIO = int(os.getenv("UPLOAD_MAX_RATIO", "100"))  # inflated / compressed size
+UPLOAD_MAX_INFLATED_BYTES = int(os.getenv("UPLOAD_MAX_INFLATED_MB", "1024")) * 1024 * 1024
+UPLOAD_EXTENSIONS = (".csv", ".csv.gz", ".zip")
+# anything that can go wrong reading/decoding/inflating the upload mid-stream
+UPLOAD_READ_ERRORS = (UnicodeDecodeError, csv.Error, OSError, EOFError, zlib.error, zipfile.BadZipFile)
+UPLOAD_TOO_LARGE_DETAIL = "Compressed CSV inflates beyond the allowed size."
+
+class _InflateLimitExceeded(OSError):
+    # an OSError so the parser treats it like any other mid-file read failure
+    pass
+
+class _InflateLimit(io.RawIOBase):
+    # caps how much a compressed upload may inflate to, checked as bytes are read
+    def __init__(self, stream, limit: int):
+        self._stream, self._left = stream, limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._stream.readinto(b)
+        self._left -= n
+        if self._left < 0:
+            raise _InflateLimitExceeded(UPLOAD_TOO_LARGE_DETAIL)
+        return n
+
+def _inflate_limit(compressed_size: int) -> int:
+    return min(UPLOAD_MAX_INFLATED_BYTES, UPLOAD_MAX_RATIO * max(compressed_size, 1))
+
+def _open_csv_text(raw, filename: str = "") -> io.TextIOWrapper:
     """
-    Upload a CSV with columns:
-      serviceId, date, description, credit, debit
-
-    Rules:
-    - enteredBy = current logged-in user (from Authorization header)
-    - Skip rows whose description contains 'monthly fee' (case-insensitive)
-      (because monthly fee is auto-generated by system)
-    - Detect duplicates per service:
-        same serviceId + date + description + credit + debit
-      -> skip those as duplicates
-    - If date is before service.startDate -> row is invalid and skipped
-    - Partially process file: insert all valid, non-duplicate, non-monthly rows
-    - Return summary with counts.
+    Decode a binary upload incrementally (BOM-aware); csv does its own newline handling.
+    .csv.gz and single-entry .zip uploads are inflated as a stream, never in full.
     """
-    # ---- Basic file checks ----
-    if not file.filename.lower().endswith(".csv"):
-        raise HTTPException(status_code=400, detail="Please upload a CSV file.")
+    name = (filename or "").lower()
+    if name.endswith(".gz"):
+        compressed = raw.seek(0, os.SEEK_END)
+        raw.seek(0)
+        stream = io.BufferedReader(_InflateLimit(gzip.GzipFile(fileobj=raw, mode="rb"), _inflate_limit(compressed)))
+    elif name.endswith(".zip"):
+        try:
+            zf = zipfile.ZipFile(raw)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Unable to read ZIP file.")
+        entries = [i for i in zf.infolist() if not i.is_dir() and not i.filename.startswith("__MACOSX/")]
+        if len(entries) != 1 or not entries[0].filename.lower().endswith(".csv"):
+            raise HTTPException(status_code=400, detail="ZIP upload must contain exactly one .csv file.")
+        entry = entries[0]
+        limit = _inflate_limit(entry.compress_size)
+        if entry.file_size > limit:
+            raise HTTPException(status_code=413, detail=UPLOAD_TOO_LARGE_DETAIL)
+        stream = io.BufferedReader(_InflateLimit(zf.open(entry), limit))
+    else:
+        stream = raw
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
 
+async def _read_csv_header(reader) -> Dict[str, int]:
+    # normalized column name (strip + lower) -> index; 400 on an unusable header
     try:
-        raw_bytes = await file.read()
-        text = raw_bytes.decode("utf-8-sig")  # handle BOM if present
-    except Exception:
+        header = await asyncio.to_thread(next, reader, None)
+    except _InflateLimitExceeded:
+        raise HTTPException(status_code=413, detail=UPLOAD_TOO_LARGE_DETAIL)
+    except UPLOAD_READ_ERRORS:
         raise HTTPException(status_code=400, detail="Unable to read CSV file.")
-
-    if not text.strip():
+    if not header or not any(h.strip() for h in header):
         raise HTTPException(status_code=400, detail="CSV file is empty.")
 
-    reader = csv.DictReader(io.StringIO(text))
-    # Normalize fieldnames (strip + lower)
-    if not reader.fieldnames:
-        raise HTTPException(status_code=400, detail="CSV has no header row.")
-
-    header_map = {h.strip().lower(): h for h in reader.fieldnames}
-    required = ["serviceid", "date", "description", "credit", "debit"]
-    missing_cols = [col for col in required if col not in header_map]
+    cols = {h.strip().lower(): i for i, h in enumerate(header)}
+    missing_cols = [col for col in UPLOAD_REQUIRED_COLUMNS if col not in cols]
     if missing_cols:
         raise HTTPException(
             status_code=400,
             detail=f"Missing required columns in CSV: {', '.join(missing_cols)}",
         )
+    return cols
 
-    username = get_username_from_request(request) or "System"
+def _parse_statement_row(raw: List[str], cols: Dict[str, int], row_no: int):
+    # -> (row dict | None, error | None); (None, None) means a skipped monthly-fee row
+    def col(name):
+        i = cols[name]
+        return (raw[i] if i < len(raw) else "").strip()
 
-    # Collect raw rows from CSV
-    parsed_rows: list[dict] = []
-    row_errors: list[str] = []
-    monthly_skipped = 0
+    service_id, date_str, desc = col("serviceid"), col("date"), col("description")
+    credit_str, debit_str = col("credit"), col("debit")
 
-    for idx, row in enumerate(reader, start=2):  # 2 = data row (header is 1)
-        try:
-            service_id = (row.get(header_map["serviceid"]) or "").strip()
-            date_str = (row.get(header_map["date"]) or "").strip()
-            desc = (row.get(header_map["description"]) or "").strip()
-            credit_str = (row.get(header_map["credit"]) or "").strip()
-            debit_str = (row.get(header_map["debit"]) or "").strip()
-
-            if not service_id or not date_str or not desc:
-                row_errors.append(f"Row {idx}: Missing serviceId/date/description")
-                continue
+    if not service_id or not date_str or not desc:
+        return None, f"Row {row_no}: Missing serviceId/date/description"
 
-            # Exclude any 'monthly fee' rows (case-insensitive)
-            if "monthly fee" in desc.lower():
-                monthly_skipped += 1
-                continue
+    # Exclude any 'monthly fee' rows (case-insensitive)
+    if "monthly fee" in desc.lower():
+        return None, None
 
-            try:
-                credit = float(credit_str) if credit_str else 0.0
-            except ValueError:
-                row_errors.append(f"Row {idx}: Invalid credit value '{credit_str}'")
-                continue
+    try:
+        credit = float(credit_str) if credit_str else 0.0
+    except ValueError:
+        return None, f"Row {row_no}: Invalid credit value '{credit_str}'"
 
-            try:
-                debit = float(debit_str) if debit_str else 0.0
-            except ValueError:
-                row_errors.append(f"Row {idx}: Invalid debit value '{debit_str}'")
-                continue
+    try:
+        debit = float(debit_str) if debit_str else 0.0
+    except ValueError:
+        return None, f"Row {row_no}: Invalid debit value '{debit_str}'"
 
-            d = _parse_date_any(date_str)
-            if not d:
-                row_errors.append(f"Row {idx}: Invalid date '{date_str}'")
-                continue
+    d = _parse_date_any(date_str)
+    if not d:
+        return None, f"Row {row_no}: Invalid date '{date_str}'"
 
-            parsed_rows.append(
-                {
-                    "csv_row": idx,
-                    "serviceId": service_id,
-                    "date": d,
-                    "description": desc,
-                    "credit": credit,
-                    "debit": debit,
-                }
-            )
+    return {
+        "csv_row": row_no,
+        "serviceId": service_id,
+        "date": d,
+        "description": desc,
+        "credit": credit,
+        "debit": debit,
+    }, None
+
+def _parse_statement_chunk(reader, cols: Dict[str, int], next_idx: int, limit: int):
+    """
+    Parse up to `limit` data rows from `reader` (runs in a worker thread).
+    Returns (rows, row_errors, monthly_skipped, next_idx, exhausted, read_exc); a read/decode/inflate
+    failure ends the file there, keeping the rows parsed before it, with read_exc set.
+    """
+    rows: list[dict] = []
+    errors: list[str] = []
+    monthly_skipped = 0
+    idx = next_idx
+    raws = iter(reader)
+    while True:
+        try:
+            raw = next(raws)
+        except StopIteration:
+            break
+        except UPLOAD_READ_ERRORS as e:
+            return rows, errors, monthly_skipped, idx, True, e
+        if not raw:
+            continue  # blank line
+        try:
+            row, err = _parse_statement_row(raw, cols, idx)
         except Exception as e:
-            row_errors.append(f"Row {idx}: {str(e)}")
-            continue
-
-    if not parsed_rows and not monthly_skipped:
-        raise HTTPException(status_code=400, detail="No valid rows found in CSV.")
-
-    # Group rows by serviceId to reduce DB work
-    rows_by_service: dict[str, list[dict]] = {}
-    for r in parsed_rows:
-        rows_by_service.setdefault(r["serviceId"], []).append(r)
+            row, err = None, f"Row {idx}: {str(e)}"
+        if row:
+            rows.append(row)
+        elif err:
+            errors.append(err)
+        else:
+            monthly_skipped += 1
+        idx += 1
+        if idx - next_idx >= limit:
+            return rows, errors, monthly_skipped, idx, False, None
+    return rows, errors, monthly_skipped, idx, True, None
 
+async def import_statement_rows(db: AsyncSession, reader, cols: Dict[str, int], username: str, on_progress=None) -> Dict:
+    """
+    Stream rows from a csv reader into yi.statements, one chunk at a time.
+    Parsing runs in a worker thread; each chunk is one STATEMENT_IMPORT_SQL and its own commit,
+    so memory stays flat however large the file is.
+    `on_progress(parsed, inserted)` is awaited after every chunk.
+    If the file turns unreadable part way, chunks before it are already committed: the summary
+    is still returned, with `read_error` / `stopped_at_row` set (400 only if nothing was inserted).
+    """
     inserted_count = 0
     duplicate_count = 0
     invalid_before_start = 0
+    monthly_skipped = 0
+    parsed_count = 0
     services_not_found: set[str] = set()
+    touched_months: set[tuple] = set()
+    row_errors: list[str] = []
+    dropped_errors = 0
 
-    # Process each service separately
-    for service_id, rows in rows_by_service.items():
-        svc = await db.get(Service, service_id)
-        if not svc:
-            services_not_found.add(service_id)
-            continue
+    def add_error(msg: str):
+        nonlocal dropped_errors
+        if len(row_errors) < UPLOAD_MAX_ROW_ERRORS:
+            row_errors.append(msg)
+        else:
+            dropped_errors += 1
 
-        # Load existing statements once for this service
-        res = await db.execute(select(Statement).where(Statement.serviceId == service_id))
-        existing = res.scalars().all()
-
-        # Build a set for duplicate detection: (date, desc, credit, debit)
-        existing_keys = set()
-        for s in existing:
-            key = (
-                s.date.isoformat() if s.date else "",
-                (s.description or "").strip().lower(),
-                float(s.credit or 0),
-                float(s.debit or 0),
+    service_starts: dict[str, Optional[date]] = {}  # serviceId -> startDate, for services seen so far
+
+    next_idx, exhausted, read_exc = 2, False, None  # 2 = first data row (header is 1)
+    while not exhausted:
+        rows, errors, skipped, next_idx, exhausted, read_exc = await asyncio.to_thread(
+            _parse_statement_chunk, reader, cols, next_idx, UPLOAD_INSERT_BATCH
+        )
+        for msg in errors:
+            add_error(msg)
+        monthly_skipped += skipped
+        parsed_count += len(rows)
+
+        # resolve every new serviceId in this chunk with one query
+        new_ids = {r["serviceId"] for r in rows} - service_starts.keys() - services_not_found
+        if new_ids:
+            res = await db.execute(
+                select(Service.serviceId, Service.startDate).where(Service.serviceId.in_(new_ids))
             )
-            existing_keys.add(key)
+            service_starts.update(res.all())
+            services_not_found.update(new_ids - service_starts.keys())
 
+        pending: dict[str, dict] = {}  # new statement id -> parsed CSV row
         for r in rows:
-            # Validate date is not before service.startDate
-            if svc.startDate and r["date"] < svc.startDate:
-                invalid_before_start += 1
-                row_errors.append(
-                    f"Row {r['csv_row']}: Date {r['date']} is before service start date {svc.startDate}"
-                )
+            service_id = r["serviceId"]
+            if service_id not in service_starts:
                 continue
 
-            key = (
-                r["date"].isoformat(),
-                r["description"].strip().lower(),
-                float(r["credit"] or 0),
-                float(r["debit"] or 0),
-            )
-            if key in existing_keys:
-                # exact duplicate of existing (date + description + credit + debit)
-                duplicate_count += 1
-                row_errors.append(
-                    f"Row {r['csv_row']}: Duplicate statement already exists for service {service_id}"
-                )
+            # Validate date is not before service.startDate
+            start_d = service_starts[service_id]
+            if start_d and r["date"] < start_d:
+                invalid_before_start += 1
+                add_error(f"Row {r['csv_row']}: Date {r['date']} is before service start date {start_d}")
                 continue
+            pending[str(uuid.uuid4())] = r
+
+        if pending:
+            kinds = [fee_kind_for_description(r["description"]) for r in pending.values()]
+            res = await db.execute(STATEMENT_IMPORT_SQL, {
+                "ids": list(pending),
+                "sids": [r["serviceId"] for r in pending.values()],
+                "dates": [r["date"] for r in pending.values()],
+                "descs": [r["description"] for r in pending.values()],
+                "credits": [r["credit"] for r in pending.values()],
+                "debits": [r["debit"] for r in pending.values()],
+                "kinds": kinds,
+                "periods": [first_day_of_month(r["date"]) if k else None for r, k in zip(pending.values(), kinds)],
+                "entered_by": username,
+                "created_at": datetime.utcnow(),
+            })
+            inserted_ids = set(res.scalars().all())
+            inserted_count += len(inserted_ids)
+            for new_id, r in pending.items():
+                if new_id in inserted_ids:
+                    touched_months.add((r["serviceId"], first_day_of_month(r["date"])))
+                else:
+                    # same service + date + description + credit + debit already stored (or earlier in
+                    # this file), or a system fee for that month already exists
+                    duplicate_count += 1
+                    add_error(f"Row {r['csv_row']}: Duplicate statement already exists for service {r['serviceId']}")
+            await db.commit()
+
+        if on_progress:
+            await on_progress(next_idx - 2, inserted_count)
+
+    read_error = f"Unable to read CSV file at row {next_idx}: {read_exc}" if read_exc else None
+    if read_error and not inserted_count:
+        too_large = isinstance(read_exc, _InflateLimitExceeded)
+        raise HTTPException(status_code=413 if too_large else 400, detail=read_error)
+    if not parsed_count and not monthly_skipped:
+        raise HTTPException(status_code=400, detail="No valid rows found in CSV.")
 
-            # Create new Statement
-            new_stmt = Statement(
-                id=str(uuid.uuid4()),
-                serviceId=service_id,
-                date=r["date"],
-                description=r["description"],
-                credit=r["credit"],
-                debit=r["debit"],
-                enteredBy=username,
-                created_at=datetime.utcnow(),
-            )
-            db.add(new_stmt)
-            inserted_count += 1
-            # Add to existing_keys so further rows in the same file are checked
-            existing_keys.add(key)
-
-        # After processing rows for this service, run budget check (context date = today)
-        await check_and_log_budget_exceed(db, service_id, username)
-
+    # After inserting, run budget check for every (service, month) the file touched
+    for service_id, month in sorted(touched_months):
+        await check_and_log_budget_exceed(db, service_id, username, month.isoformat(), commit=False)
     await db.commit()
 
+    if dropped_errors:
+        row_errors.append(f"... {dropped_errors} more row errors not shown")
+
     # Build response summary
     detail_parts = [
         f"Inserted: {inserted_count}",
@@ -2059,9 +3141,13 @@ async def upload_statements_csv(
         detail_parts.append(
             f"Unknown services in CSV: {', '.join(sorted(services_not_found))}"
         )
+    if read_error:
+        # rows above this line are saved; re-uploading the whole file skips them as duplicates
+        detail_parts.append(f"Stopped early: {read_error}")
+        row_errors.append(read_error)
 
     return {
-        "message": "Statement CSV processed",
+        "message": "Statement CSV partially processed" if read_error else "Statement CSV processed",
         "summary": " | ".join(detail_parts),
         "inserted": inserted_count,
         "skipped_monthly_fee": monthly_skipped,
@@ -2069,48 +3155,378 @@ async def upload_statements_csv(
         "skipped_before_start": invalid_before_start,
         "services_not_found": sorted(services_not_found),
         "row_errors": row_errors,  # list of per-row issues for UI display if needed
+        "read_error": read_error,
+        "stopped_at_row": next_idx if read_error else None,
         "uploaded_by": username,
     }
 
+IMPORT_SPOOL_DIR = os.getenv("IMPORT_SPOOL_DIR") or tempfile.gettempdir()
+IMPORT_JOB_CONCURRENCY = int(os.getenv("IMPORT_JOB_CONCURRENCY", "2"))  # imports run at once per worker
+IMPORT_JOB_STALE_MINUTES = 15  # a queued/running job not updated for this long died with its worker
+IMPORT_JOB_HEARTBEAT_SECONDS = 60  # live jobs refresh updated_at this often, even while queued
+_import_job_slots = asyncio.Semaphore(IMPORT_JOB_CONCURRENCY)
+_import_job_tasks: set = set()
+
+def _import_job_to_json(job: ImportJob) -> Dict:
+    def ts(v):
+        return v.isoformat(timespec="seconds") if v else None
+    return {
+        "id": str(job.id),
+        "kind": job.kind,
+        "status": job.status,
+        "filename": job.filename,
+        "created_by": job.created_by,
+        "created_at": ts(job.created_at),
+        "started_at": ts(job.started_at),
+        "finished_at": ts(job.finished_at),
+        "updated_at": ts(job.updated_at),
+        "rows_parsed": job.rows_parsed,
+        "rows_inserted": job.rows_inserted,
+        "rows_skipped": job.rows_skipped,
+        "result": job.result,
+        "error": job.error,
+    }
+
+async def _update_import_job(job_id, **fields):
+    fields["updated_at"] = datetime.utcnow()
+    async with AsyncSessionLocal() as jdb:
+        await jdb.execute(update(ImportJob).where(ImportJob.id == job_id).values(**fields))
+        await jdb.commit()
+
+async def _import_job_heartbeat(job_id):
+    # keeps a job that waits for a slot (or sits in a long chunk) from looking abandoned
+    while True:
+        await asyncio.sleep(IMPORT_JOB_HEARTBEAT_SECONDS)
+        try:
+            await _update_import_job(job_id)
+        except Exception as e:
+            print(f"⚠ Import job {job_id} heartbeat failed: {e.__class__.__name__}")
+
+async def _run_import_job(job_id, path: str, filename: str, cols: Dict[str, int], username: str):
+    async def progress(parsed: int, inserted: int):
+        await _update_import_job(job_id, rows_parsed=parsed, rows_inserted=inserted, rows_skipped=parsed - inserted)
+
+    heartbeat = asyncio.create_task(_import_job_heartbeat(job_id))
+    try:
+        async with _import_job_slots:
+            await _update_import_job(job_id, status="running", started_at=datetime.utcnow())
+            with open(path, "rb") as raw:
+                reader = csv.reader(_open_csv_text(raw, filename))
+                await asyncio.to_thread(next, reader, None)  # header, validated at upload time
+                async with AsyncSessionLocal() as db:
+                    result = await import_statement_rows(db, reader, cols, username, on_progress=progress)
+            if result["read_error"]:
+                # partial: the counts in result are committed, the rest of the file was not read
+                await _update_import_job(job_id, status="failed", finished_at=datetime.utcnow(),
+                                         result=result, error=result["read_error"])
+                print(f"⚠ Import job {job_id} stopped early: {result['summary']}")
+            else:
+                await _update_import_job(job_id, status="done", finished_at=datetime.utcnow(), result=result)
+                print(f"✅ Import job {job_id}: {result['summary']}")
+    except asyncio.CancelledError:
+        # server shutdown; chunks committed so far stay, their counts are in the progress fields
+        print(f"⚠ Import job {job_id} interrupted by shutdown")
+        await _update_import_job(job_id, status="failed", finished_at=datetime.utcnow(),
+                                 error="Interrupted: worker stopped")
+        raise
+    except Exception as e:
+        error = e.detail if isinstance(e, HTTPException) else f"{e.__class__.__name__}: {e}"
+        print(f"❌ Import job {job_id} failed: {error}")
+        await _update_import_job(job_id, status="failed", finished_at=datetime.utcnow(), error=str(error))
+    finally:
+        heartbeat.cancel()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+async def fail_stale_import_jobs():
+    # jobs whose worker went away would otherwise report "queued"/"running" forever;
+    # live ones heartbeat every IMPORT_JOB_HEARTBEAT_SECONDS, so only dead ones go stale
+    cutoff = datetime.utcnow() - timedelta(minutes=IMPORT_JOB_STALE_MINUTES)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(ImportJob)
+            .where(ImportJob.status.in_(["queued", "running"]),
+                   func.coalesce(ImportJob.updated_at, ImportJob.created_at) < cutoff)
+            .values(status="failed", finished_at=datetime.utcnow(), error="Interrupted: worker stopped")
+        )
+        await db.commit()
+
+@api.post("/services/statements/upload-csv")
+async def upload_statements_csv(
+    file: UploadFile = File(...),
+    request: Request = None,
+    async_: bool = Query(False, alias="async"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Upload a CSV (plain, .csv.gz or a .zip holding one .csv) with columns:
+      serviceId, date, description, credit, debit
+
+    Rules:
+    - enteredBy = current logged-in user (from Authorization header)
+    - Skip rows whose description contains 'monthly fee' (case-insensitive)
+      (because monthly fee is auto-generated by system)
+    - Detect duplicates per service:
+        same serviceId + date + description + credit + debit
+      -> skip those as duplicates
+    - If date is before service.startDate -> row is invalid and skipped
+    - Partially process file: insert all valid, non-duplicate, non-monthly rows
+      (streamed in chunks of UPLOAD_INSERT_BATCH rows, each committed as it goes)
+    - Return summary with counts.
+
+    With `?async=1` the file is spooled to disk and imported in the background;
+    the response is {"job_id": ..., "status": "queued"} and progress / the final
+    summary are available from GET /api/jobs/{job_id}.
+    """
+    # ---- Basic file checks ----
+    if not file.filename.lower().endswith(UPLOAD_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Please upload a CSV file (.csv, .csv.gz or .zip).")
+
+    file.file.seek(0)
+    reader = csv.reader(await asyncio.to_thread(_open_csv_text, file.file, file.filename))
+    cols = await _read_csv_header(reader)
+    username = get_username_from_request(request) or "System"
+
+    if not async_:
+        return await import_statement_rows(db, reader, cols, username)
+
+    # spool to our own file: the upload's temp file is gone once this request returns
+    # spooled as uploaded (still compressed); the job inflates it as it reads
+    fd, path = tempfile.mkstemp(prefix="stmt-import-", dir=IMPORT_SPOOL_DIR)
+    def spool():
+        file.file.seek(0)
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(file.file, out, 1024 * 1024)
+    try:
+        await asyncio.to_thread(spool)
+    except Exception:
+        os.remove(path)
+        raise
+
+    job = ImportJob(kind="statement_import", status="queued", filename=file.filename,
+                    created_by=username, created_at=datetime.utcnow(), updated_at=datetime.utcnow())
+    db.add(job)
+    await db.commit()
+
+    task = asyncio.create_task(_run_import_job(job.id, path, file.filename, cols, username))
+    _import_job_tasks.add(task)
+    task.add_done_callback(_import_job_tasks.discard)
+    return {"message": "Statement CSV queued", "job_id": str(job.id), "status": "queued"}
+
+@api.get("/jobs/{job_id}")
+async def get_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    try:
+        job = await db.get(ImportJob, uuid.UUID(job_id))
+    except ValueError:
+        job = None
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _import_job_to_json(job)
+
+# -------------------------------------------------------------------
+# Rendered export cache (statement PDF / CSV)
+# -------------------------------------------------------------------
+# Entries are keyed on the service's ledger_version, so a write never needs to evict
+# anything: the next download simply asks for a key that isn't cached yet.
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_MB", "64")) * 1024 * 1024
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR") or None  # optional disk tier, shareable between workers
+RENDER_CACHE_DISK_MAX_BYTES = int(os.getenv("RENDER_CACHE_DISK_MAX_MB", "512")) * 1024 * 1024
+_render_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_render_cache_bytes = 0
+_render_disk_bytes: Optional[int] = None  # this worker's view of the disk tier, counted on first write
+
+def render_cache_key(*parts) -> str:
+    return hashlib.sha256(json.dumps([str(p) for p in parts]).encode()).hexdigest()[:40]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _render_cache_remember(key: str, data: bytes):
+    global _render_cache_bytes
+    if key in _render_cache or len(data) > RENDER_CACHE_MAX_BYTES // 4:
+        return
+    _render_cache[key] = data
+    _render_cache_bytes += len(data)
+    while _render_cache_bytes > RENDER_CACHE_MAX_BYTES:
+        _, old = _render_cache.popitem(last=False)
+        _render_cache_bytes -= len(old)
+
+def _render_disk_read(key: str) -> Optional[bytes]:
+    path = os.path.join(RENDER_CACHE_DIR, key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # mtime doubles as last-used time for trimming
+        return data
+    except OSError:
+        return None
+
+def _render_disk_write(key: str, data: bytes):
+    global _render_disk_bytes
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=RENDER_CACHE_DIR)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(RENDER_CACHE_DIR, key))
+    if _render_disk_bytes is None or _render_disk_bytes + len(data) > RENDER_CACHE_DISK_MAX_BYTES:
+        # (re)count and drop least recently used files down to 90% of the budget
+        files = []
+        for e in os.scandir(RENDER_CACHE_DIR):
+            if e.is_file() and not e.name.startswith(".tmp-"):
+                st = e.stat()
+                files.append((st.st_mtime, st.st_size, e.path))
+        total = sum(sz for _, sz, _ in files)
+        if total > RENDER_CACHE_DISK_MAX_BYTES:
+            for _, sz, path in sorted(files):
+                if total <= RENDER_CACHE_DISK_MAX_BYTES * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= sz
+                except OSError:
+                    pass
+        _render_disk_bytes = total
+    else:
+        _render_disk_bytes += len(data)
+
+async def render_cache_get(key: str) -> Optional[bytes]:
+    data = _render_cache.get(key)
+    if data is not None:
+        _render_cache.move_to_end(key)
+        return data
+    if RENDER_CACHE_DIR:
+        data = await asyncio.to_thread(_render_disk_read, key)
+        if data is not None:
+            _render_cache_remember(key, data)
+        return data
+    return None
+
+async def render_cache_put(key: str, data: bytes):
+    _render_cache_remember(key, data)
+    if RENDER_CACHE_DIR:
+        try:
+            await asyncio.to_thread(_render_disk_write, key, data)
+        except OSError as e:
+            print(f"⚠ Render cache disk write failed: {e}")
+
+def _export_headers(filename: str, etag: str) -> Dict[str, str]:
+    return {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",  # always revalidate; unchanged ledgers get a 304
+    }
+
+def _export_response(data: bytes, media_type: str, filename: str, etag: str) -> StreamingResponse:
+    return StreamingResponse(BytesIO(data), media_type=media_type, headers=_export_headers(filename, etag))
+
 # -------------------------------------------------------------------
-# PDF export
+# Streaming CSV
 # -------------------------------------------------------------------
-@api.get("/services/{service_id}/statements/download")
-async def download_statements(service_id: str, db: AsyncSession = Depends(get_db)):
-    svc = await db.get(Service, service_id)
-    if not svc:
-        raise HTTPException(status_code=404, detail="Service not found")
+CSV_STREAM_BATCH = 500  # rows fetched per cursor round trip, and written per flushed chunk
 
-    client_id = (svc.clientId or "").strip()
-    client = await db.get(Client, client_id) if client_id else None
-    client_name = f"{(client.first_name if client else '')}_{(client.last_name if client else '')}".strip("_") or client_id
+def stream_csv(stmt, head: List[list], row_fn, *, bom: bool = False, lineterminator: str = "\r\n",
+               on_complete=None, keep_limit: int = 0):
+    """
+    Async generator of CSV bytes for `stmt`, read through a server-side cursor.
+    Runs in its own session: the request's session is already closed once the body streams.
+    `head` is a list of rows, or an async fn(session) returning them; it reads the same
+    REPEATABLE READ snapshot as the rows. row_fn(index, row) -> list. When on_complete is
+    given, output up to keep_limit bytes is kept and handed to it after the last row.
+    """
+    async def gen():
+        buf = StringIO()
+        writer = csv.writer(buf, lineterminator=lineterminator)
+        kept, keep = [], on_complete is not None
+
+        def drain() -> bytes:
+            nonlocal keep
+            data = buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+            if keep:
+                kept.append(data)
+                keep = sum(len(k) for k in kept) <= keep_limit
+            return data
+
+        idx = 0
+        async with AsyncSessionLocal() as session:
+            await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            if bom:
+                buf.write("\ufeff")
+            writer.writerows(await head(session) if callable(head) else head)
+            yield drain()
+            result = await session.stream(stmt.execution_options(yield_per=CSV_STREAM_BATCH))
+            async for part in result.partitions():
+                for row in part:
+                    idx += 1
+                    writer.writerow(row_fn(idx, row))
+                yield drain()
+        if keep:
+            await on_complete(b"".join(kept))
+
+    return gen()
 
-    res = await db.execute(select(Statement).where(Statement.serviceId == service_id))
-    stmts = res.scalars().all()
-    if not stmts:
-        raise HTTPException(status_code=404, detail="No statements found")
+# -------------------------------------------------------------------
+# PDF export
+# -------------------------------------------------------------------
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))  # renderer processes per API worker
+PDF_RENDER_QUEUE = int(os.getenv("PDF_RENDER_QUEUE", "8"))      # renders running or waiting before we shed load
+PDF_RENDER_RETRY_AFTER = 5  # seconds
+_pdf_render_slots = asyncio.Semaphore(PDF_RENDER_QUEUE)
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+def _pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_executor
+    if _pdf_executor is None:
+        # spawn, not fork: the API process has a running loop and pooled DB connections
+        _pdf_executor = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pdf_executor
+
+async def render_pdf_in_pool(fn, *args) -> bytes:
+    """
+    Run a ReportLab render function in the renderer pool so layout never blocks the event loop.
+    fn must be a module-level function taking plain, picklable values.
+    """
+    if _pdf_render_slots.locked():
+        raise HTTPException(status_code=503, detail="PDF renderer is busy, please retry shortly.",
+                            headers={"Retry-After": str(PDF_RENDER_RETRY_AFTER)})
+    async with _pdf_render_slots:
+        return await _pool_render(fn, *args)
+
+async def _pool_render(fn, *args) -> bytes:
+    # callers hold a _pdf_render_slots slot
+    global _pdf_executor
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pdf_pool(), fn, *args)
+    except BrokenProcessPool:
+        _pdf_executor = None  # a renderer died; the next request gets a fresh pool
+        print("⚠ PDF renderer pool crashed; restarting on next request.")
+        raise HTTPException(status_code=503, detail="PDF renderer restarting, please retry shortly.",
+                            headers={"Retry-After": str(PDF_RENDER_RETRY_AFTER)})
+
+_statement_template: Optional[Dict] = None
 
-    indexed = list(enumerate(stmts))
-    indexed.sort(key=lambda item: (item[1].date or date.max, item[0]))
-    data = [r for _, r in indexed]
+def _statement_pdf_template() -> Dict:
+    """
+    Static parts of the statement PDF, built once per process so each render only lays out
+    the per-service data. The flowables are shared between builds; keep per-statement data out.
+    """
+    global _statement_template
+    if _statement_template is not None:
+        return _statement_template
 
-    total_credit = sum(float(s.credit or 0) for s in data)
-    total_debit  = sum(float(s.debit or 0)  for s in data)
-    balance = total_credit - total_debit
+    # binary image streams: without the C accelerator, ASCII85-encoding the logo cost more than the layout
+    rl_config.useA85 = 0
 
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    buf = BytesIO()
-    doc = SimpleDocTemplate(
-        buf, pagesize=A4, leftMargin=1*cm, rightMargin=1*cm, topMargin=1*cm, bottomMargin=1*cm
-    )
     styles = getSampleStyleSheet()
-    elements = []
-
     center_title = ParagraphStyle("CenterTitle", parent=styles["Title"], alignment=1)
     center_subtitle = ParagraphStyle("CenterSubtitle", parent=styles["Heading2"], alignment=1)
-    elements.append(Paragraph("<b>Your Ideal</b>", center_title))
-    elements.append(Paragraph("<b>Statement of Account</b>", center_subtitle))
-    elements.append(Spacer(1, 0.4 * cm))
 
     address = Paragraph(
         """<para alignment='right'><font size=7>
@@ -2124,8 +3540,9 @@ async def download_statements(service_id: str, db: AsyncSession = Depends(get_db
     )
 
     try:
-        logo_path = os.path.join(BASE_DIR, "static", "logo.png")
-        logo = Image(logo_path, width=3.2 * cm, height=3.2 * cm)
+        # read once; the Image keeps the decoded logo for every later build
+        with open(os.path.join(BASE_DIR, "static", "logo.png"), "rb") as f:
+            logo = Image(BytesIO(f.read()), width=3.2 * cm, height=3.2 * cm)
     except Exception:
         logo = Paragraph("<b>Your Ideal</b>", styles["Title"])
 
@@ -2136,191 +3553,626 @@ async def download_statements(service_id: str, db: AsyncSession = Depends(get_db
         ("RIGHTPADDING", (0, 0), (-1, -1), 0),
     ]))
 
-    today = datetime.now().strftime("%d-%b-%Y")
-    right_align_bold = ParagraphStyle(name="RightAlignBold", parent=styles["Normal"], alignment=2, fontName="Helvetica-Bold")
+    footer = Table([[
+        Paragraph(
+            """<font size=8><b>Your Ideal</b> | Unit 7, 1 The Parade, Monarch Way, Newbury Park, London IG2 7HT |
+            Phone: 020 8518 2536 | Email: finance@yourideal.co.uk | Web: www.yourideal.co.uk</font>""",
+            styles["Normal"]
+        )
+    ]])
+    footer.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, -1), colors.HexColor("#0070C0")),
+        ("TEXTCOLOR", (0, 0), (-1, -1), colors.white),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("PADDING", (0, 0), (-1, -1), 4)
+    ]))
+
+    _statement_template = {
+        "normal": styles["Normal"],
+        "right_bold": ParagraphStyle(name="RightAlignBold", parent=styles["Normal"], alignment=2, fontName="Helvetica-Bold"),
+        "title": [
+            Paragraph("<b>Your Ideal</b>", center_title),
+            Paragraph("<b>Statement of Account</b>", center_subtitle),
+            Spacer(1, 0.4 * cm),
+        ],
+        "right_block": right_block,
+        "info_style": TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+            ("FONTSIZE", (0, 0), (-1, -1), 9),
+            ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+            ("TOPPADDING", (0, 0), (-1, -1), 2),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+            ("LEFTPADDING", (0, 0), (-1, -1), 3),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 3),
+            ("BACKGROUND", (0, 2), (-1, 2), colors.HexColor("#FFFCE5")),
+            ("BACKGROUND", (0, 3), (-1, 3), colors.HexColor("#00C146")),
+            ("BACKGROUND", (0, 4), (-1, 4), colors.HexColor("#DA4711")),
+        ]),
+        "top_style": TableStyle([
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+        ]),
+        "ledger_headers": ["S.No", "Date", "Description", "Credit (£)", "Debit (£)", "Balance (£)"],
+        "ledger_widths": [1.2 * cm, 2.4 * cm, 8.0 * cm, 2.2 * cm, 2.2 * cm, 2.2 * cm],
+        # column-wide commands instead of five per row: striped rows, fixed money-column colours
+        "ledger_style": TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.black),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#91BEE5")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+            ("FONTSIZE", (0, 0), (-1, 0), 8),
+            ("ROWBACKGROUNDS", (0, 1), (2, -1), [colors.white, colors.whitesmoke]),
+            ("BACKGROUND", (3, 1), (3, -1), colors.HexColor("#00C456")),
+            ("BACKGROUND", (4, 1), (4, -1), colors.HexColor("#FFAD85")),
+            ("BACKGROUND", (5, 1), (5, -1), colors.HexColor("#FFEE9B")),
+            ("ALIGN", (3, 1), (5, -1), "RIGHT"),
+        ]),
+        # per-service summary on the client-level statement; last row is the total
+        "summary_style": TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.black),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#91BEE5")),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, -1), 8),
+            ("ALIGN", (2, 0), (-1, -1), "RIGHT"),
+            ("ROWBACKGROUNDS", (0, 1), (-1, -2), [colors.white, colors.whitesmoke]),
+            ("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#FFEE9B")),
+        ]),
+        "section": styles["Heading3"],
+        # the brought-forward line that opens a range and every continuation page
+        "carried_style": TableStyle([
+            ("FONTNAME", (0, 1), (-1, 1), "Helvetica-Oblique"),
+        ]),
+        "footer": footer,
+    }
+    return _statement_template
+
+# Ledger rows are single-line strings, so fixed row heights let each page's table be
+# sized up front instead of ReportLab measuring and re-splitting one huge table.
+# Descriptions are flattened and cut to the column (_ledger_description) to keep that true.
+LEDGER_HEADER_H = 16
+LEDGER_ROW_H = 18
+LEDGER_DESC_FONT = ("Helvetica", 10)  # Table cell default
+LEDGER_DESC_WIDTH = 8.0 * cm - 12     # description column less its 6pt side paddings
+
+def _ledger_description(text: Optional[str]) -> str:
+    # one line: newlines/tabs/runs of spaces collapse, overlong text ends in an ellipsis
+    text = " ".join((text or "").split())
+    if stringWidth(text, *LEDGER_DESC_FONT) <= LEDGER_DESC_WIDTH:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if stringWidth(text[:mid].rstrip() + "…", *LEDGER_DESC_FONT) <= LEDGER_DESC_WIDTH:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + "…"
+
+def _ledger_page_tables(tpl: Dict, table_rows: List[list], first_room: float, page_room: float,
+                        opening_row: Optional[list]) -> list:
+    """
+    Split formatted ledger rows into one Table per page. Each table repeats the header
+    row and opens with the balance brought forward from the previous page.
+    """
+    def rows_fitting(room: float) -> int:
+        return int((room - LEDGER_HEADER_H) // LEDGER_ROW_H)
+
+    out = []
+    fit = rows_fitting(first_room)
+    if fit < 2:  # not even a carried line and one entry: start the ledger on a fresh page
+        out.append(PageBreak())
+        fit = rows_fitting(page_room)
+    pos = 0
+    while True:
+        if pos:
+            head = ["", "", "Balance brought forward", "", "", table_rows[pos - 1][5]]
+        else:
+            head = opening_row
+        take = fit - (1 if head else 0)
+        data = [tpl["ledger_headers"]] + ([head] if head else []) + table_rows[pos:pos + take]
+        table = Table(data, colWidths=tpl["ledger_widths"], repeatRows=1,
+                      rowHeights=[LEDGER_HEADER_H] + [LEDGER_ROW_H] * (len(data) - 1))
+        table.setStyle(tpl["ledger_style"])
+        if head:
+            table.setStyle(tpl["carried_style"])
+        out.append(table)
+        pos += take
+        if pos >= len(table_rows):
+            return out
+        out.append(PageBreak())
+        fit = rows_fitting(page_room)
+
+def _statement_heading(tpl: Dict, client_id: str, today: str, total_credit: float, total_debit: float,
+                       balance: float) -> list:
+    elements = list(tpl["title"])
     info_data = [
-        ["Date", Paragraph(today, right_align_bold)],
+        ["Date", Paragraph(today, tpl["right_bold"])],
         ["Client ID", client_id],
         ["Total Amount Paid", f"£ {total_debit:,.2f}"],
         ["Total Remittance Amount", f"£ {total_credit:,.2f}"],
         ["Credit / Overdrawn", f"£ {abs(balance):,.2f}"],
     ]
     info_table = Table(info_data, colWidths=[4 * cm, 5 * cm])
-    info_table.setStyle(TableStyle([
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-        ("FONTSIZE", (0, 0), (-1, -1), 9),
-        ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
-        ("TOPPADDING", (0, 0), (-1, -1), 2),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
-        ("LEFTPADDING", (0, 0), (-1, -1), 3),
-        ("RIGHTPADDING", (0, 0), (-1, -1), 3),
-        ("BACKGROUND", (0, 2), (-1, 2), colors.HexColor("#FFFCE5")),
-        ("BACKGROUND", (0, 3), (-1, 3), colors.HexColor("#00C146")),
-        ("BACKGROUND", (0, 4), (-1, 4), colors.HexColor("#DA4711")),
-    ]))
+    info_table.setStyle(tpl["info_style"])
 
-    top_section = Table([[info_table, right_block]], colWidths=[10 * cm, 7 * cm])
-    top_section.setStyle(TableStyle([
-        ("VALIGN", (0, 0), (-1, -1), "TOP"),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
-    ]))
+    top_section = Table([[info_table, tpl["right_block"]]], colWidths=[10 * cm, 7 * cm])
+    top_section.setStyle(tpl["top_style"])
     elements.append(top_section)
     elements.append(Spacer(1, 0.05 * cm))
 
     note_text = f"<b>Note:</b> {'Credit' if balance >= 0 else 'Overdrawn'} of £{abs(balance):,.2f}"
-    elements.append(Paragraph(note_text, styles["Normal"]))
+    elements.append(Paragraph(note_text, tpl["normal"]))
     elements.append(Spacer(1, 0.3 * cm))
+    return elements
 
-    headers = ["S.No", "Date", "Description", "Credit (£)", "Debit (£)", "Balance (£)"]
-    table_data = [headers]
-    running = 0.0
-    for i, s in enumerate(data, 1):
-        credit = float(s.credit or 0)
-        debit = float(s.debit or 0)
+def _ledger_table_rows(rows: List[tuple], opening: float) -> List[list]:
+    running = opening
+    table_rows = []
+    for i, (d, description, credit, debit) in enumerate(rows, 1):
         running += credit - debit
-        table_data.append([
+        table_rows.append([
             str(i),
-            s.date.strftime("%d/%m/%Y") if s.date else "",
-            s.description or "",
+            d.strftime("%d/%m/%Y") if d else "",
+            _ledger_description(description),
             f"{credit:,.2f}" if credit else "",
             f"{debit:,.2f}" if debit else "",
             f"{running:,.2f}",
         ])
+    return table_rows
+
+def _opening_row(start_d: Optional[date], opening: float) -> Optional[list]:
+    return ["", start_d.strftime("%d/%m/%Y"), "Balance brought forward", "", "", f"{opening:,.2f}"] if start_d else None
+
+def _room_after(doc, flowables: list) -> float:
+    # frame height less its 6pt top/bottom padding and whatever the given flowables take
+    room = doc.height - 12
+    for f in flowables:
+        room -= f.wrap(doc.width, doc.height)[1] + f.getSpaceBefore() + f.getSpaceAfter()
+    return room
+
+def _statement_doc(buf):
+    return SimpleDocTemplate(buf, pagesize=A4, leftMargin=1*cm, rightMargin=1*cm, topMargin=1*cm, bottomMargin=1*cm)
 
-    col_widths = [1.2 * cm, 2.4 * cm, 8.0 * cm, 2.2 * cm, 2.2 * cm, 2.2 * cm]
-    table = Table(table_data, colWidths=col_widths)
-    style = TableStyle([
-        ("GRID", (0, 0), (-1, -1), 0.25, colors.black),
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#91BEE5")),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-        ("FONTSIZE", (0, 0), (-1, 0), 8),
-    ])
-    for i in range(1, len(table_data)):
-        bg = colors.whitesmoke if i % 2 == 0 else colors.white
-        style.add("BACKGROUND", (0, i), (-1, i), bg)
-        style.add("BACKGROUND", (3, i), (3, i), colors.HexColor("#00C456"))
-        style.add("BACKGROUND", (4, i), (4, i), colors.HexColor("#FFAD85"))
-        style.add("BACKGROUND", (5, i), (5, i), colors.HexColor("#FFEE9B"))
-        style.add("ALIGN", (3, i), (5, i), "RIGHT")
-    table.setStyle(style)
-    elements.append(table)
+def render_statement_pdf(client_id: str, today: str, opening: float, total_credit: float, total_debit: float,
+                         start_d: Optional[date], rows: List[tuple]) -> bytes:
+    # runs in the renderer pool; rows are (date, description, credit, debit) tuples in ledger order
+    tpl = _statement_pdf_template()
+    balance = opening + total_credit - total_debit
+
+    buf = BytesIO()
+    doc = _statement_doc(buf)
+    elements = _statement_heading(tpl, client_id, today, total_credit, total_debit, balance)
+    elements.extend(_ledger_page_tables(
+        tpl, _ledger_table_rows(rows, opening), _room_after(doc, elements), _room_after(doc, []),
+        _opening_row(start_d, opening),
+    ))
     elements.append(Spacer(1, 0.5 * cm))
+    elements.append(tpl["footer"])
 
-    footer = Table([[
-        Paragraph(
-            """<font size=8><b>Your Ideal</b> | Unit 7, 1 The Parade, Monarch Way, Newbury Park, London IG2 7HT |
-            Phone: 020 8518 2536 | Email: finance@yourideal.co.uk | Web: www.yourideal.co.uk</font>""",
-            styles["Normal"]
-        )
-    ]])
-    footer.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, -1), colors.HexColor("#0070C0")),
-        ("TEXTCOLOR", (0, 0), (-1, -1), colors.white),
-        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-        ("PADDING", (0, 0), (-1, -1), 4)
-    ]))
-    elements.append(footer)
+    doc.build(elements)
+    return buf.getvalue()
+
+def render_client_statement_pdf(client_id: str, today: str, start_d: Optional[date], sections: List[tuple]) -> bytes:
+    """
+    One statement for all of a client's services: overall totals and a per-service summary
+    up front, then each service's ledger as its own section starting on a fresh page.
+    sections are (service_id, label, opening, credit, debit, rows) in service order.
+    """
+    tpl = _statement_pdf_template()
+    total_credit = sum(sec[3] for sec in sections)
+    total_debit = sum(sec[4] for sec in sections)
+    balance = sum(sec[2] for sec in sections) + total_credit - total_debit
+
+    buf = BytesIO()
+    doc = _statement_doc(buf)
+    elements = _statement_heading(tpl, client_id, today, total_credit, total_debit, balance)
+
+    summary = [["Service", "Type", "Opening (£)", "Credit (£)", "Debit (£)", "Balance (£)"]]
+    for sid, label, opening, credit, debit, _ in sections:
+        summary.append([sid, label, f"{opening:,.2f}", f"{credit:,.2f}", f"{debit:,.2f}",
+                        f"{opening + credit - debit:,.2f}"])
+    summary.append(["Total", "", f"{balance - total_credit + total_debit:,.2f}", f"{total_credit:,.2f}",
+                    f"{total_debit:,.2f}", f"{balance:,.2f}"])
+    summary_table = Table(summary, colWidths=[4.6 * cm, 3.6 * cm, 2.2 * cm, 2.2 * cm, 2.2 * cm, 2.2 * cm], repeatRows=1)
+    summary_table.setStyle(tpl["summary_style"])
+    elements.append(summary_table)
+
+    page_room = _room_after(doc, [])
+    for sid, label, opening, credit, debit, rows in sections:
+        heading = [
+            # Paragraph text is markup: ids and service types may hold & or <
+            Paragraph(f"<b>{xml_escape(sid)}</b>{' — ' + xml_escape(label) if label else ''}", tpl["section"]),
+            Paragraph(f"Balance £{opening + credit - debit:,.2f}", tpl["normal"]),
+            Spacer(1, 0.2 * cm),
+        ]
+        elements.append(PageBreak())
+        elements.extend(heading)
+        elements.extend(_ledger_page_tables(
+            tpl, _ledger_table_rows(rows, opening), _room_after(doc, heading), page_room,
+            _opening_row(start_d, opening),
+        ))
+    elements.append(Spacer(1, 0.5 * cm))
+    elements.append(tpl["footer"])
 
     doc.build(elements)
-    buf.seek(0)
+    return buf.getvalue()
+
+@api.get("/services/{service_id}/statements/download")
+async def download_statements(service_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                              if_none_match: Optional[str] = Header(default=None), db: AsyncSession = Depends(get_db)):
+    svc = await db.get(Service, service_id)  # read first: the version must not be newer than the rows
+    if not svc:
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    client_id = (svc.clientId or "").strip()
+    client = await db.get(Client, client_id) if client_id else None
+    client_name = f"{(client.first_name if client else '')}_{(client.last_name if client else '')}".strip("_") or client_id
     filename = str(client_name).replace(" ", "_").replace("/", "_") + ".pdf"
-    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return StreamingResponse(buf, media_type="application/pdf", headers=headers)
+
+    start_d, end_d = _parse_date_range(start, end)
+
+    today = datetime.now().strftime("%d-%b-%Y")  # printed on the statement, so part of the key
+    key = render_cache_key("pdf", service_id, start_d, end_d, svc.ledger_version, today)
+    etag = f'"{key}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    cached = await render_cache_get(key)
+    if cached is not None:
+        return _export_response(cached, "application/pdf", filename, etag)
+
+    # only in-range rows are read; the brought-forward balance comes from the monthly snapshots
+    key_date = _ledger_sort_keys()[0]
+    conds = [Statement.serviceId == service_id]
+    if start_d:
+        conds.append(key_date >= start_d)
+    if end_d:
+        conds.append(key_date <= end_d)
+    res = await db.execute(
+        select(Statement.date, Statement.description, Statement.credit, Statement.debit)
+        .where(*conds).order_by(*_ledger_sort_keys())
+    )
+    rows = [(d, desc or "", float(cr or 0), float(dr or 0)) for d, desc, cr, dr in res.all()]
+    if not rows and not (await db.execute(
+        select(Statement.id).where(Statement.serviceId == service_id).limit(1)
+    )).first():
+        raise HTTPException(status_code=404, detail="No statements found")
+
+    opening = await ledger_balance_before(db, service_id, start_d) if start_d else 0.0
+    total_credit = sum(r[2] for r in rows)
+    total_debit  = sum(r[3] for r in rows)
+
+    pdf = await render_pdf_in_pool(
+        render_statement_pdf, client_id, today, opening, total_credit, total_debit, start_d, rows,
+    )
+    await render_cache_put(key, pdf)
+    return _export_response(pdf, "application/pdf", filename, etag)
+
+# -------------------------------------------------------------------
+# Month-end statement bundles (ZIP of per-service PDFs)
+# -------------------------------------------------------------------
+class _ZipStreamSink:
+    # write-only target for zipfile (unseekable, so entries get data descriptors);
+    # the bundle generator drains it after every entry
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+def _parse_month(value: Optional[str]) -> date:
+    try:
+        return datetime.strptime((value or "").strip(), "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month must be YYYY-MM")
+
+async def _statement_bundle_response(db: AsyncSession, month: Optional[str], council: Optional[Council]) -> StreamingResponse:
+    """
+    Load every service with ledger rows in the month (optionally one council's), then stream
+    a ZIP whose entries are added as the renderer pool finishes each PDF.
+    All DB work happens here; the generator only renders and zips.
+    """
+    start_d = _parse_month(month)
+    end_d = last_day_of_month(start_d)
+    key_date = _ledger_sort_keys()[0]
+    in_month = and_(key_date >= start_d, key_date <= end_d)
+
+    q = (
+        select(Service.serviceId, Service.clientId, Service.ledger_version, Client.first_name, Client.last_name)
+        .join(Client, Client.id == Service.clientId)
+        .where(Service.serviceId.in_(select(Statement.serviceId).where(in_month)))
+        .order_by(Service.serviceId)
+    )
+    if council is not None:
+        q = q.where(Client.councilId == council.id)
+    services = (await db.execute(q)).all()
+    if not services:
+        raise HTTPException(status_code=404, detail=f"No statements found for {start_d:%Y-%m}")
+    if _pdf_render_slots.locked():
+        raise HTTPException(status_code=503, detail="PDF renderer is busy, please retry shortly.",
+                            headers={"Retry-After": str(PDF_RENDER_RETRY_AFTER)})
+    sids = [sv.serviceId for sv in services]
+
+    openings = await ledger_openings(db, sids, start_d)
+
+    res = await db.execute(
+        select(Statement.serviceId, Statement.date, Statement.description, Statement.credit, Statement.debit)
+        .where(Statement.serviceId.in_(sids), in_month)
+        .order_by(Statement.serviceId, *_ledger_sort_keys())
+    )
+    ledger: Dict[str, List[tuple]] = {}
+    for sid, d, desc, cr, dr in res.all():
+        ledger.setdefault(sid, []).append((d, desc or "", float(cr or 0), float(dr or 0)))
+
+    today = datetime.now().strftime("%d-%b-%Y")
+    jobs = []
+    for sv in services:
+        rows = ledger.get(sv.serviceId, [])
+        name = f"{sv.first_name or ''}_{sv.last_name or ''}".strip("_") or sv.clientId
+        entry = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{name}_{sv.serviceId}") + ".pdf"
+        key = render_cache_key("pdf", sv.serviceId, start_d, end_d, sv.ledger_version, today)
+        args = ((sv.clientId or "").strip(), today, openings.get(sv.serviceId, 0.0),
+                sum(r[2] for r in rows), sum(r[3] for r in rows), start_d, rows)
+        jobs.append((entry, key, args))
+    del ledger
+
+    async def render_one(key: str, args: tuple) -> bytes:
+        pdf = await render_cache_get(key)
+        if pdf is None:
+            pdf = await _pool_render(render_statement_pdf, *args)
+            await render_cache_put(key, pdf)
+        return pdf
+
+    async def stream():
+        sink = _ZipStreamSink()
+        pending: Dict[asyncio.Task, str] = {}
+        queue = iter(jobs)
+        stamp = datetime.now().timetuple()[:6]
+        async with _pdf_render_slots:  # the whole bundle counts as one queued render
+            try:
+                with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:  # PDFs are already compressed
+                    while True:
+                        # keep every renderer busy, but never more PDFs in memory than renderers
+                        while len(pending) < PDF_RENDER_WORKERS:
+                            job = next(queue, None)
+                            if job is None:
+                                break
+                            entry, key, args = job
+                            pending[asyncio.create_task(render_one(key, args))] = entry
+                        if not pending:
+                            break
+                        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            zf.writestr(zipfile.ZipInfo(pending.pop(task), stamp), task.result())
+                            yield sink.take()
+                yield sink.take()  # central directory
+            finally:
+                for task in pending:
+                    task.cancel()
+
+    label = re.sub(r"[^A-Za-z0-9_.-]+", "_", council.name if council else "All_Councils")
+    headers = {"Content-Disposition": f'attachment; filename="Statements_{label}_{start_d:%Y-%m}.zip"'}
+    return StreamingResponse(stream(), media_type="application/zip", headers=headers)
+
+@api.get("/councils/{cid}/statements/bundle")
+async def council_statement_bundle(cid: int, month: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    council = await db.get(Council, cid)
+    if not council:
+        raise HTTPException(status_code=404, detail="Council not found")
+    return await _statement_bundle_response(db, month, council)
+
+@api.get("/statements/bundle")
+async def portfolio_statement_bundle(month: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    return await _statement_bundle_response(db, month, None)
 
 # -------------------------------------------------------------------
 # CSV export
 # -------------------------------------------------------------------
 @api.get("/services/{service_id}/statements/report/csv")
-async def download_statements_csv(service_id: str, start: Optional[str] = None, end: Optional[str] = None, db: AsyncSession = Depends(get_db)):
-    svc = await db.get(Service, service_id)
+async def download_statements_csv(service_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                                  if_none_match: Optional[str] = Header(default=None), db: AsyncSession = Depends(get_db)):
+    svc = await db.get(Service, service_id)  # read first: the version must not be newer than the rows
     if not svc:
         raise HTTPException(status_code=404, detail="Service not found")
 
     client_id = (svc.clientId or "").strip()
     client = await db.get(Client, client_id) if client_id else None
     client_name = (f"{(client.first_name if client else '')} {(client.last_name if client else '')}".strip()) or client_id
+    fn = f"Statement_Report_{client_name.replace(' ','_')}_{service_id}.csv"
 
-    res = await db.execute(select(Statement).where(Statement.serviceId == service_id))
-    stmts = res.scalars().all()
-    if not stmts:
-        raise HTTPException(status_code=404, detail="No statements found")
+    start_d, end_d = _parse_date_range(start, end)
 
-    indexed = list(enumerate(stmts))
-    indexed.sort(key=lambda item: ((item[1].date or date.max), item[0]))
-    rows = [r for _, r in indexed]
+    # the client name is written into the report, so a rename must miss too
+    key = render_cache_key("csv", service_id, start_d, end_d, svc.ledger_version, client_name)
+    etag = f'"{key}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    cached = await render_cache_get(key)
+    if cached is not None:
+        return _export_response(cached, "text/csv", fn, etag)
 
-    total_credit = sum(float(x.credit or 0) for x in rows)
-    total_debit  = sum(float(x.debit or 0)  for x in rows)
-    balance_up_to_date = total_credit - total_debit
+    if not (await db.execute(select(Statement.id).where(Statement.serviceId == service_id).limit(1))).first():
+        raise HTTPException(status_code=404, detail="No statements found")
 
-    running_vals = []
+    # only in-range rows are read; the opening balance comes from the monthly snapshots
+    key_date = _ledger_sort_keys()[0]
+    conds = [Statement.serviceId == service_id]
+    if start_d:
+        conds.append(key_date >= start_d)
+    if end_d:
+        conds.append(key_date <= end_d)
+    stmt = (
+        select(Statement.date, Statement.description, Statement.credit, Statement.debit)
+        .where(*conds).order_by(*_ledger_sort_keys())
+    )
     running = 0.0
-    for r in rows:
-        running += (float(r.credit or 0) - float(r.debit or 0))
-        running_vals.append(running)
-
-    start_d = _parse_date_any(start) if start else None
-    end_d   = _parse_date_any(end)   if end   else None
-
-    filtered = []
-    for i, r in enumerate(rows):
-        d = r.date
-        if start_d and d and d < start_d: continue
-        if end_d   and d and d > end_d:   continue
-        filtered.append((i, r))
-    if not (start or end):
-        filtered = list(enumerate(rows))
+
+    async def head(session):
+        nonlocal running
+        balance_up_to_date = await ledger_balance(session, service_id)
+        running = await ledger_balance_before(session, service_id, start_d) if start_d else 0.0
+        return [
+            ["Client ID", client_id],
+            ["Client Name", client_name],
+            ["Balance Up To Date", f"£{balance_up_to_date:.2f}"],
+            [],
+            ["S.No", "Date", "Description", "Credit", "Debit", "Balance"],
+        ]
+
+    def row(idx, r):
+        nonlocal running
+        d, desc, cr, dbv = r
+        cr = float(cr or 0); dbv = float(dbv or 0)
+        running += cr - dbv
+        return [idx, d.strftime("%d/%m/%Y") if d else "", desc or "", cr if cr else "", dbv if dbv else "", f"{running:.2f}"]
+
+    body = stream_csv(stmt, head, row, bom=True, lineterminator="\n",
+                      on_complete=lambda data: render_cache_put(key, data), keep_limit=RENDER_CACHE_MAX_BYTES // 4)
+    return StreamingResponse(body, media_type="text/csv", headers=_export_headers(fn, etag))
+
+# -------------------------------------------------------------------
+# Client statements (every service of one client in one document)
+# -------------------------------------------------------------------
+async def _client_statement_services(db: AsyncSession, client_id: str):
+    client = await db.get(Client, client_id)
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+    # versions are read before any ledger row, as for the single-service exports
+    res = await db.execute(
+        select(Service.serviceId, Service.serviceType, Service.ledger_version)
+        .where(Service.clientId == client_id).order_by(Service.serviceId)
+    )
+    services = res.all()
+    if not services:
+        raise HTTPException(status_code=404, detail="No services found")
+    return client, services
+
+async def _client_statement_sections(db: AsyncSession, services, start_d: Optional[date], end_d: Optional[date]) -> List[tuple]:
+    """
+    All services' in-range rows in one ordered query, grouped and totalled in a single pass.
+    Returns (service_id, label, opening, credit, debit, rows) per service.
+    """
+    sids = [sv.serviceId for sv in services]
+    openings = await ledger_openings(db, sids, start_d) if start_d else {}
+    key_date = _ledger_sort_keys()[0]
+    conds = [Statement.serviceId.in_(sids)]
+    if start_d:
+        conds.append(key_date >= start_d)
+    if end_d:
+        conds.append(key_date <= end_d)
+    res = await db.execute(
+        select(Statement.serviceId, Statement.date, Statement.description, Statement.credit, Statement.debit)
+        .where(*conds).order_by(Statement.serviceId, *_ledger_sort_keys())
+    )
+    acc = {sid: [[], 0.0, 0.0] for sid in sids}
+    for sid, d, desc, cr, dr in res.all():
+        cr, dr = float(cr or 0), float(dr or 0)
+        a = acc[sid]
+        a[0].append((d, desc or "", cr, dr))
+        a[1] += cr
+        a[2] += dr
+    return [
+        (sv.serviceId, sv.serviceType or "", openings.get(sv.serviceId, 0.0), acc[sv.serviceId][1],
+         acc[sv.serviceId][2], acc[sv.serviceId][0])
+        for sv in services
+    ]
+
+@api.get("/clients/{client_id}/statements/download")
+async def download_client_statement(client_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                                    if_none_match: Optional[str] = Header(default=None), db: AsyncSession = Depends(get_db)):
+    client, services = await _client_statement_services(db, client_id)
+    client_name = f"{client.first_name or ''}_{client.last_name or ''}".strip("_") or client_id
+    filename = str(client_name).replace(" ", "_").replace("/", "_") + "_all_services.pdf"
+    start_d, end_d = _parse_date_range(start, end)
+
+    today = datetime.now().strftime("%d-%b-%Y")
+    key = render_cache_key("client-pdf", client_id, start_d, end_d,
+                           [(sv.serviceId, sv.ledger_version) for sv in services], today)
+    etag = f'"{key}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    cached = await render_cache_get(key)
+    if cached is not None:
+        return _export_response(cached, "application/pdf", filename, etag)
+
+    sections = await _client_statement_sections(db, services, start_d, end_d)
+    pdf = await render_pdf_in_pool(render_client_statement_pdf, client_id, today, start_d, sections)
+    await render_cache_put(key, pdf)
+    return _export_response(pdf, "application/pdf", filename, etag)
+
+@api.get("/clients/{client_id}/statements/report/csv")
+async def download_client_statement_csv(client_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                                        if_none_match: Optional[str] = Header(default=None), db: AsyncSession = Depends(get_db)):
+    client, services = await _client_statement_services(db, client_id)
+    client_name = f"{client.first_name or ''} {client.last_name or ''}".strip() or client_id
+    fn = f"Statement_Report_{client_name.replace(' ', '_')}_{client_id}.csv"
+    start_d, end_d = _parse_date_range(start, end)
+
+    key = render_cache_key("client-csv", client_id, start_d, end_d,
+                           [(sv.serviceId, sv.ledger_version) for sv in services], client_name)
+    etag = f'"{key}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    cached = await render_cache_get(key)
+    if cached is not None:
+        return _export_response(cached, "text/csv", fn, etag)
+
+    sections = await _client_statement_sections(db, services, start_d, end_d)
+    if start_d or end_d:
+        balance_up_to_date = sum((await ledger_balances(db, [sec[0] for sec in sections])).values())
+    else:
+        balance_up_to_date = sum(opening + cr - dr for _, _, opening, cr, dr, _ in sections)
 
     out = StringIO()
-    def w(line): out.write(line + "\n")
-    w(f"Client ID,{client_id}")
-    w(f"Client Name,{client_name}")
-    w(f"Balance Up To Date,£{balance_up_to_date:.2f}")
-    w("")
-    w("S.No,Date,Description,Credit,Debit,Balance")
-    for idx, (abs_i, r) in enumerate(filtered, 1):
-        cr = float(r.credit or 0); dbv = float(r.debit or 0)
-        desc = (r.description or "").replace(",", " ")
-        w(f'{idx},{r.date.strftime("%d/%m/%Y") if r.date else ""},"{desc}",{cr if cr else ""},{dbv if dbv else ""},{running_vals[abs_i]:.2f}')
+    w = csv.writer(out)
+    w.writerow(["Client ID", client_id])
+    w.writerow(["Client Name", client_name])
+    w.writerow(["Balance Up To Date", f"£{balance_up_to_date:.2f}"])
+    for sid, label, opening, credit, debit, rows in sections:
+        w.writerow([])
+        w.writerow(["Service", sid, label])
+        if start_d:
+            w.writerow(["Balance Brought Forward", f"{opening:.2f}"])
+        w.writerow(["S.No", "Date", "Description", "Credit", "Debit", "Balance"])
+        running = opening
+        for idx, (d, desc, cr, dr) in enumerate(rows, 1):
+            running += cr - dr
+            w.writerow([idx, d.strftime("%d/%m/%Y") if d else "", desc,
+                        f"{cr:.2f}" if cr else "", f"{dr:.2f}" if dr else "", f"{running:.2f}"])
+        w.writerow(["Service Balance", f"{running:.2f}"])
     csv_bytes = out.getvalue().encode("utf-8-sig")
-    fn = f"Statement_Report_{client_name.replace(' ','_')}_{service_id}.csv"
-    headers = {"Content-Disposition": f'attachment; filename="{fn}"'}
-    return StreamingResponse(BytesIO(csv_bytes), media_type="text/csv", headers=headers)
+    await render_cache_put(key, csv_bytes)
+    return _export_response(csv_bytes, "text/csv", fn, etag)
+
 # -------------------------------------------------------------------
 # Address CSV export
 # -------------------------------------------------------------------
 @api.get("/clients/{client_id}/addresses/csv")
 async def download_client_addresses_csv(client_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(ClientAddress).where(ClientAddress.client_id == client_id))
-    addresses = result.scalars().all()
-
-    if not addresses:
+    if not (await db.execute(select(ClientAddress.id).where(ClientAddress.client_id == client_id).limit(1))).first():
         raise HTTPException(status_code=404, detail="No address history found")
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["House Number", "Street", "City", "Country", "Postcode", "Created At"])
-
-    for a in addresses:
-        writer.writerow(
-            [
-                a.house_no,
-                a.street,
-                a.city,
-                a.country,
-                a.postcode,
-                a.created_at.isoformat(timespec="seconds") if a.created_at else "",
-            ]
-        )
+    stmt = select(
+        ClientAddress.house_no, ClientAddress.street, ClientAddress.city,
+        ClientAddress.country, ClientAddress.postcode, ClientAddress.created_at,
+    ).where(ClientAddress.client_id == client_id)
 
-    csv_data = output.getvalue()
-    output.close()
+    def row(_, a):
+        return [*a[:5], a.created_at.isoformat(timespec="seconds") if a.created_at else ""]
 
-    return Response(
-        content=csv_data,
+    return StreamingResponse(
+        stream_csv(stmt, [["House Number", "Street", "City", "Country", "Postcode", "Created At"]], row),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=client_{client_id}_address_history.csv",
@@ -2332,54 +4184,191 @@ async def download_client_addresses_csv(client_id: str, db: AsyncSession = Depen
 # -------------------------------------------------------------------
 @api.get("/clients/{client_id}/kins/csv")
 async def download_client_kins_csv(client_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(ClientKin).where(ClientKin.client_id == client_id))
-    kins = result.scalars().all()
-
-    if not kins:
+    if not (await db.execute(select(ClientKin.id).where(ClientKin.client_id == client_id).limit(1))).first():
         raise HTTPException(status_code=404, detail="No kin history found")
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(
-        [
-            "Name",
-            "Relationship",
-            "House Number",
-            "Street",
-            "City",
-            "Country",
-            "Postcode",
-            "Email",
-            "Created At",
-        ]
-    )
-
-    for k in kins:
-        writer.writerow(
-            [
-                k.kin_name,
-                k.kin_relationship,
-                k.house_no,
-                k.street,
-                k.city,
-                k.country,
-                k.postcode,
-                k.email,
-                k.created_at.isoformat(timespec="seconds") if k.created_at else "",
-            ]
-        )
-
-    csv_data = output.getvalue()
-    output.close()
+    stmt = select(
+        ClientKin.kin_name, ClientKin.kin_relationship, ClientKin.house_no, ClientKin.street,
+        ClientKin.city, ClientKin.country, ClientKin.postcode, ClientKin.email, ClientKin.created_at,
+    ).where(ClientKin.client_id == client_id)
+    head = [[
+        "Name",
+        "Relationship",
+        "House Number",
+        "Street",
+        "City",
+        "Country",
+        "Postcode",
+        "Email",
+        "Created At",
+    ]]
+
+    def row(_, k):
+        return [*k[:8], k.created_at.isoformat(timespec="seconds") if k.created_at else ""]
 
-    return Response(
-        content=csv_data,
+    return StreamingResponse(
+        stream_csv(stmt, head, row),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=client_{client_id}_kin_history.csv",
         },
     )
 
+# -------------------------------------------------------------------
+# Client & service report (portfolio CSV)
+# -------------------------------------------------------------------
+def _report_num(v) -> str:
+    # same text the browser export produced from the service JSON (null -> 0, 100.0 -> "100")
+    f = float(v or 0)
+    return str(int(f)) if f.is_integer() else repr(f)
+
+def _report_disabilities(v) -> str:
+    return ", ".join(str(d) for d in v) if v else "-"
+
+def _report_address(r) -> str:
+    return _format_address_parts(r.addr_house_no, r.addr_street, r.addr_city, r.addr_country, r.addr_postcode)
+
+def _report_total(r, col: str) -> str:
+    if r.svc_id is None:
+        return ""
+    credit, debit = float(r.total_credit or 0), float(r.total_debit or 0)
+    value = {"credit": credit, "debit": debit}.get(col, credit - debit)
+    return f"{value:.2f}"
+
+def _report_service(fn):
+    # service columns are blank on the single row of a client without services
+    return lambda r: "" if r.svc_id is None else fn(r)
+
+# field id -> (label, join group, value); ids and labels match the picker in clientmanagement.js
+CLIENT_REPORT_FIELDS: Dict[str, tuple] = {
+    "client_Title": ("Title", None, lambda r: r.title or ""),
+    "client_first_name": ("First Name", None, lambda r: r.first_name or ""),
+    "client_last_name": ("Last Name", None, lambda r: r.last_name or ""),
+    "client_id": ("Client ID", None, lambda r: r.client_id),
+    "client_council": ("Council", None, lambda r: r.council if r.councilId and r.council else "Unknown"),
+    "client_status": ("Status", None, lambda r: r.status or ""),
+    "client_phone": ("Phone", None, lambda r: r.phone or ""),
+    "client_email": ("Email", None, lambda r: r.email or ""),
+    "client_dob": ("DOB", None, lambda r: r.dob.isoformat() if r.dob else ""),
+    "client_gender": ("Gender", None, lambda r: r.gender or ""),
+    "client_disabilities": ("Disability", None, lambda r: _report_disabilities(r.disabilities)),
+    "client_language": ("Language", None, lambda r: r.language or ""),
+    "client_ethnicity_type": ("Ethnicity Type", None, lambda r: r.ethnicity_type or ""),
+    "client_ethnicity": ("Ethnicity", None, lambda r: r.ethnicity or ""),
+    "addr_house_no": ("House Number", "address", lambda r: r.addr_house_no or ""),
+    "addr_street": ("Street", "address", lambda r: r.addr_street or ""),
+    "addr_city": ("City", "address", lambda r: r.addr_city or ""),
+    "addr_country": ("Country", "address", lambda r: r.addr_country or ""),
+    "addr_postcode": ("Postcode", "address", lambda r: r.addr_postcode or ""),
+    "addr_full": ("Full Address", "address", _report_address),
+    "kin_name": ("Kin Name", "kin", lambda r: r.kin_name or ""),
+    "kin_relationship": ("Kin Relationship", "kin", lambda r: r.kin_relationship or ""),
+    "kin_email": ("Kin Email", "kin", lambda r: r.kin_email or ""),
+    "service_id": ("Service ID", None, lambda r: r.svc_id or ""),
+    "service_type": ("Service Type", None, lambda r: r.serviceType or ""),
+    "service_reference": ("YIL Reference No", None, lambda r: r.reference or ""),
+    "service_setup_fee": ("Setup Fee", None, lambda r: r.setupFee or ""),
+    "service_setup_budget": ("Setup Budget", None, _report_service(lambda r: _report_num(r.setupBudget))),
+    "service_start_date": ("Start Date", None, lambda r: _ddmmyyyy(r.startDate)),
+    "service_end_date": ("End Date", None, lambda r: _ddmmyyyy(r.endDate)),
+    "service_referred_by": ("Referred By", None, lambda r: r.referredBy or ""),
+    "service_insurance": ("Insurance", None, lambda r: r.insurance or ""),
+    "service_monthly_fee": ("Monthly Fee", None, _report_service(lambda r: _report_num(r.monthlyFee))),
+    "service_initial_fee": ("Initial Fee", None, _report_service(lambda r: _report_num(r.initialFee))),
+    "service_pension_setup": ("Pension Setup", None, _report_service(lambda r: _report_num(r.pensionSetup))),
+    "service_pension_fee": ("Pension Fee", None, _report_service(lambda r: _report_num(r.pensionFee))),
+    "service_annual_fee": ("Annual Fee", None, _report_service(lambda r: _report_num(r.annualFee))),
+    "service_year_end_fee": ("Year End Fee", None, _report_service(lambda r: _report_num(r.yearEndFee))),
+    "service_carer_budget": ("Carer Budget", None, _report_service(lambda r: _report_num(r.carerBudget))),
+    "service_agency_budget": ("Agency Budget", None, _report_service(lambda r: _report_num(r.agencyBudget))),
+    "total_paid": ("Total Paid (Debit)", "totals", lambda r: _report_total(r, "debit")),
+    "total_remittance": ("Total Remittance (Credit)", "totals", lambda r: _report_total(r, "credit")),
+    "balance": ("Balance (Credit - Debit)", "totals", lambda r: _report_total(r, "balance")),
+}
+
+def _service_totals_subquery():
+    # all-time SUM(credit)/SUM(debit) per service: dated rows from the monthly rollup,
+    # undated rows (never rolled up) straight from statements via ix_statements_undated
+    parts = union_all(
+        select(ServiceMonthSpend.service_id.label("sid"),
+               ServiceMonthSpend.credit.label("credit"), ServiceMonthSpend.debit.label("debit")),
+        select(Statement.serviceId, func.coalesce(Statement.credit, 0), func.coalesce(Statement.debit, 0))
+        .where(Statement.date.is_(None)),
+    ).subquery()
+    return (
+        select(parts.c.sid, func.sum(parts.c.credit).label("credit"), func.sum(parts.c.debit).label("debit"))
+        .group_by(parts.c.sid)
+        .subquery()
+    )
+
+def _client_report_query(groups: set, q: str):
+    """
+    One row per client + service (one row for a client without services), ordered by client
+    then service. Current address / kin and statement totals are joined only when asked for.
+    """
+    cols = [
+        Client.id.label("client_id"), Client.title, Client.first_name, Client.last_name,
+        Client.councilId, Council.name.label("council"), Client.status, Client.phone, Client.email,
+        Client.dob, Client.gender, Client.disabilities, Client.language,
+        Client.ethnicity_type, Client.ethnicity,
+        Service.serviceId.label("svc_id"), Service.serviceType, Service.reference, Service.setupFee,
+        Service.setupBudget, Service.startDate, Service.endDate, Service.referredBy, Service.insurance,
+        Service.monthlyFee, Service.initialFee, Service.pensionSetup, Service.pensionFee,
+        Service.annualFee, Service.yearEndFee, Service.carerBudget, Service.agencyBudget,
+    ]
+    stmt = (
+        select(*cols)
+        .outerjoin(Council, Council.id == Client.councilId)
+        .outerjoin(Service, Service.clientId == Client.id)
+    )
+    if "address" in groups:
+        addr_sq, LatestAddr = _latest_per_client(ClientAddress)
+        stmt = stmt.add_columns(
+            LatestAddr.house_no.label("addr_house_no"), LatestAddr.street.label("addr_street"),
+            LatestAddr.city.label("addr_city"), LatestAddr.country.label("addr_country"),
+            LatestAddr.postcode.label("addr_postcode"),
+        ).outerjoin(addr_sq, true())
+    if "kin" in groups:
+        kin_sq, LatestKin = _latest_per_client(ClientKin)
+        stmt = stmt.add_columns(
+            LatestKin.kin_name, LatestKin.kin_relationship, LatestKin.email.label("kin_email"),
+        ).outerjoin(kin_sq, true())
+    if "totals" in groups:
+        totals = _service_totals_subquery()
+        stmt = stmt.add_columns(
+            totals.c.credit.label("total_credit"), totals.c.debit.label("total_debit"),
+        ).outerjoin(totals, totals.c.sid == Service.serviceId)
+    if q:
+        # the clients the search box is showing: same match and cap as /clients/search
+        shown = _client_search_query(q, CLIENT_SEARCH_MAX).subquery()
+        stmt = stmt.where(Client.id.in_(select(shown.c.client_id)))
+    return stmt.order_by(Client.id, Service.serviceId)
+
+@api.get("/reports/clients.csv")
+async def client_report_csv(fields: str = "", q: str = ""):
+    """
+    Client & service CSV for the whole portfolio (or the clients /clients/search returns for `q`).
+    `fields` is a comma-separated list of CLIENT_REPORT_FIELDS ids, in column order.
+    """
+    ids = [f.strip() for f in fields.split(",") if f.strip()]
+    if not ids:
+        raise HTTPException(status_code=400, detail="Select at least one field")
+    unknown = [f for f in ids if f not in CLIENT_REPORT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown report fields: {', '.join(unknown)}")
+
+    picked = [CLIENT_REPORT_FIELDS[f] for f in ids]
+    stmt = _client_report_query({group for _, group, _ in picked if group}, (q or "").strip().lower())
+
+    def row(_, r):
+        return [get(r) for _, _, get in picked]
+
+    return StreamingResponse(
+        stream_csv(stmt, [[label for label, _, _ in picked]], row),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=Client_Service_Report.csv"},
+    )
+
 notes_router = APIRouter(prefix="/api/services", tags=["Notes"])
 # ============================================
 # NOTES API (FULL + EXPLICIT IDs)
@@ -2504,38 +4493,29 @@ async def export_notes_csv(service_id: str, db: AsyncSession = Depends(get_db)):
 
     client_id = svc.clientId
 
-    result = await db.execute(
-        select(ServiceNote).where(ServiceNote.service_id == service_id)
-    )
-    notes = result.scalars().all()
-
-    if not notes:
+    if not (await db.execute(select(ServiceNote.id).where(ServiceNote.service_id == service_id).limit(1))).first():
         raise HTTPException(status_code=404, detail="No notes found")
 
-    output = StringIO()
-    writer = csv.writer(output)
+    stmt = select(
+        ServiceNote.note_date, ServiceNote.description, ServiceNote.created_by, ServiceNote.created_at,
+    ).where(ServiceNote.service_id == service_id)
+    head = [["Client ID", client_id], [], ["Note Date", "Description", "Created By", "Created At"]]
 
-    writer.writerow(["Client ID", client_id])
-    writer.writerow([])
-    writer.writerow(["Note Date", "Description", "Created By", "Created At"])
-
-    for n in notes:
-        writer.writerow([
+    def row(_, n):
+        return [
             n.note_date.strftime("%Y-%m-%d"),
-            n.description.replace(",", " "),
+            n.description,
             n.created_by,
             n.created_at.strftime("%Y-%m-%d %H:%M:%S") if n.created_at else "",
-        ])
+        ]
 
-    csv_bytes = output.getvalue().encode("utf-8-sig")
     filename = f"Notes_{client_id}_{service_id}.csv"
-
     return StreamingResponse(
-        BytesIO(csv_bytes),
+        stream_csv(stmt, head, row, bom=True),
         media_type="text/csv",
         headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-    )    
-    
+    )
+
 # -------------------------------------------------------------------
 # Notifications
 # -------------------------------------------------------------------
@@ -2551,6 +4531,24 @@ async def get_notifications(db: AsyncSession = Depends(get_db)):
         } for n in items_sorted
     ]
 
+# -------------------------------------------------------------------
+# Admin: background jobs (SUPER ADMIN ONLY)
+# -------------------------------------------------------------------
+@api.get("/admin/jobs/monthly-debits")
+async def get_monthly_debit_job(user=Depends(require_super_admin), db: AsyncSession = Depends(get_db)):
+    out = _job_state_to_json(await db.get(JobState, MONTHLY_DEBIT_JOB))
+    out["running_here"] = _monthly_debit_lock.locked()
+    out["interval_seconds"] = MONTHLY_DEBIT_INTERVAL_SECONDS
+    out["next_run_at"] = _monthly_debit_next_run.isoformat(timespec="seconds") if _monthly_debit_next_run else None
+    return out
+
+@api.post("/admin/jobs/monthly-debits/run")
+async def trigger_monthly_debit_job(full: bool = False, user=Depends(require_super_admin)):
+    try:
+        return await run_monthly_debit_job(full=full)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Monthly debit job failed: {e.__class__.__name__}")
+
 # -------------------------------------------------------------------
 # Startup
 # -------------------------------------------------------------------
@@ -2560,6 +4558,7 @@ async def on_startup():
         async with engine.begin() as conn:
             await conn.execute(select(func.now()))
             await conn.run_sync(Base.metadata.create_all)
+            await apply_schema_patches(conn)
         print("✅ Database connected and tables verified/created.")
     except Exception as e:
         print(f"❌ Database connection failed: {e}")
@@ -2570,9 +4569,30 @@ async def on_startup():
     if not SUPER_ADMINS:
         print("⚠ No SUPER ADMINS configured in .env (SUPERADMINS=[...]); relying on DB users only.")
 
-    # ✅ Auto-run monthly debit generator
-    async with AsyncSessionLocal() as db:
-        await ensure_monthly_debits(db)
+    try:
+        await fail_stale_import_jobs()
+    except Exception as e:
+        print(f"⚠ Stale import job check failed: {e.__class__.__name__}: {e}")
+
+    # ✅ Monthly debit generator runs in the background (first pass immediately)
+    global _monthly_debit_task
+    _monthly_debit_task = asyncio.create_task(_monthly_debit_scheduler())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if _monthly_debit_task:
+        _monthly_debit_task.cancel()
+        try:
+            await _monthly_debit_task
+        except asyncio.CancelledError:
+            pass
+    # in-flight imports mark themselves failed as they are cancelled
+    jobs = list(_import_job_tasks)
+    for task in jobs:
+        task.cancel()
+    await asyncio.gather(*jobs, return_exceptions=True)
+    if _pdf_executor:
+        _pdf_executor.shutdown(wait=False, cancel_futures=True)
 
 app.include_router(api)
 app.include_router(notes_router)
\ No newline at end of file
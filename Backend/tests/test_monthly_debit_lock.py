@@ -0,0 +1,111 @@
+# test_monthly_debit_lock.py — concurrent monthly debit runners against a real Postgres
+# Usage: DATABASE_URL=postgresql+asyncpg://... python -m pytest Backend/tests
+# Skipped unless DATABASE_URL is set in the environment (Backend/.env is deliberately not used).
+import asyncio, json, os, subprocess, sys, time, uuid
+from datetime import date
+
+import pytest
+
+if not os.environ.get("DATABASE_URL"):
+    pytest.skip("DATABASE_URL not set; needs a local Postgres", allow_module_level=True)
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+import main
+from sqlalchemy import text
+
+RUNNERS = 6
+MONTHS = 6  # service starts MONTHS - 1 months before the current one
+
+# one uvicorn worker's worth of process: its own engine, its own advisory-lock session
+RUNNER = (
+    "import asyncio, json, main\n"
+    "out = asyncio.run(main.run_monthly_debit_job(full=True))\n"
+    "print(json.dumps({'skipped': bool(out.get('skipped'))}))\n"
+)
+
+def _months_ago(n: int) -> date:
+    d = date.today().replace(day=1)
+    for _ in range(n):
+        d = (d.replace(day=1) - date.resolution).replace(day=1)
+    return d
+
+async def _run(coro_fn):
+    try:
+        return await coro_fn()
+    finally:
+        await main.engine.dispose()
+
+async def _setup(client_id: str, service_id: str):
+    async with main.engine.begin() as conn:
+        await conn.run_sync(main.Base.metadata.create_all)
+        await main.apply_schema_patches(conn)
+        await conn.execute(text("INSERT INTO yi.clients (id, first_name) VALUES (:c, 'Lock test')"), {"c": client_id})
+        await conn.execute(
+            text('INSERT INTO yi.services ("serviceId", "clientId", "startDate", "monthlyFee") '
+                 "VALUES (:s, :c, :start, 10)"),
+            {"s": service_id, "c": client_id, "start": _months_ago(MONTHS - 1)},
+        )
+
+async def _teardown(client_id: str, service_id: str):
+    async with main.engine.begin() as conn:
+        await conn.execute(text('DELETE FROM yi.statements WHERE "serviceId" = :s'), {"s": service_id})
+        await conn.execute(text("DELETE FROM yi.service_month_spend WHERE service_id = :s"), {"s": service_id})
+        await conn.execute(text("DELETE FROM yi.clients WHERE id = :c"), {"c": client_id})
+
+async def _monthly_rows(service_id: str):
+    async with main.engine.connect() as conn:
+        res = await conn.execute(
+            text('SELECT period, count(*) FROM yi.statements '
+                 "WHERE \"serviceId\" = :s AND description LIKE 'Monthly Fee - %' GROUP BY period"),
+            {"s": service_id},
+        )
+        return dict(res.all())
+
+def _spawn():
+    return subprocess.Popen([sys.executable, "-c", RUNNER], cwd=BACKEND,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+def _result(p) -> dict:
+    out, _ = p.communicate(timeout=120)
+    assert p.returncode == 0, out
+    return json.loads(out.strip().splitlines()[-1])
+
+@pytest.fixture
+def service_id():
+    client_id = f"LT{uuid.uuid4().hex[:8]}"
+    sid = f"SV-{client_id}-0001"
+    asyncio.run(_run(lambda: _setup(client_id, sid)))
+    yield sid
+    asyncio.run(_run(lambda: _teardown(client_id, sid)))
+
+def test_concurrent_runners_do_one_pass(service_id):
+    async def scenario():
+        # hold job_state writes so whichever runner wins the advisory lock stays inside its
+        # pass until every other runner has tried the lock and given up
+        async with main.engine.connect() as gate:
+            await gate.execute(text("LOCK TABLE yi.job_state IN SHARE ROW EXCLUSIVE MODE"))
+            procs = [_spawn() for _ in range(RUNNERS)]
+            deadline = time.monotonic() + 120
+            while sum(p.poll() is not None for p in procs) < RUNNERS - 1:
+                assert time.monotonic() < deadline, "runners did not skip while the lock was held"
+                await asyncio.sleep(0.1)
+            await gate.commit()
+        return [_result(p) for p in procs]
+
+    results = asyncio.run(_run(scenario))
+    assert sum(not r["skipped"] for r in results) == 1, results
+
+    rows = asyncio.run(_run(lambda: _monthly_rows(service_id)))
+    assert len(rows) == MONTHS, rows
+    assert set(rows.values()) == {1}, rows
+
+def test_concurrent_runners_never_duplicate(service_id):
+    # no gate: passes may run back to back, but each month is still debited once
+    procs = [_spawn() for _ in range(RUNNERS)]
+    results = [_result(p) for p in procs]
+    assert any(not r["skipped"] for r in results), results
+
+    rows = asyncio.run(_run(lambda: _monthly_rows(service_id)))
+    assert len(rows) == MONTHS, rows
+    assert set(rows.values()) == {1}, rows
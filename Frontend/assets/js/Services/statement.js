@@ -521,8 +521,8 @@ export async function renderStatement(service) {
       if (!confirm("Delete this statement?")) return;
 
       deleteStatement(service.serviceId, stmtId)
-        .then((res) => {
-          statements = res.statements || [];
+        .then(() => {
+          statements = statements.filter((s) => s !== stmt);
           refresh(currentPage);
         })
         .catch((err) => {
@@ -541,7 +541,7 @@ export async function renderStatement(service) {
 
       updateStatement(service.serviceId, stmtId, updated)
         .then((res) => {
-          statements = res.statements || [];
+          statements = statements.map((s) => (s === stmt ? res.statement : s));
           refresh(currentPage);
         })
         .catch((err) => {
@@ -567,7 +567,7 @@ export async function renderStatement(service) {
 
         try {
           const res = await createStatement(service.serviceId, stmt);
-          statements = res.statements || [];
+          statements = [...statements, res.statement];
           // Jump to last page so the newly added row is visible
           const lastPage = Math.ceil((statements.length || 1) / PAGE_SIZE);
           refresh(lastPage);
@@ -616,7 +616,9 @@ export async function renderStatement(service) {
     if (dlBtn) {
       dlBtn.addEventListener("click", () =>
         requirePermission("statement", "view", () => {
-          downloadStatement(service.serviceId);
+          const start = document.getElementById("filterStartDate").value || null;
+          const end = document.getElementById("filterEndDate").value || null;
+          downloadStatement(service.serviceId, "pdf", start, end);
         })
       );
     }
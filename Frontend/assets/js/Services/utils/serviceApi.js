@@ -203,8 +203,12 @@ export async function uploadStatementsCSV(file) {
 // ============================================
 // FILE DOWNLOADS
 // ============================================
-export async function downloadStatement(serviceId, format = "pdf") {
-  const res = await fetch(`${BASE_URL}/${serviceId}/statements/download?format=${format}`, {
+export async function downloadStatement(serviceId, format = "pdf", start, end) {
+  const params = new URLSearchParams({ format });
+  if (start) params.set("start", start);
+  if (end) params.set("end", end);
+
+  const res = await fetch(`${BASE_URL}/${serviceId}/statements/download?${params}`, {
     headers: { ...authHeaders() },
     mode: "cors",
   });
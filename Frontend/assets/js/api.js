@@ -100,6 +100,33 @@ export async function fetchClients() {
   return await res.json();
 }
 
+// Server-side keyset page: { items, total, next_cursor }
+export async function fetchClientsPage({ limit = 100, cursor = null, sort = "name", council, status, created_by } = {}) {
+  const token = localStorage.getItem("token");
+  const params = new URLSearchParams({ limit: String(limit), sort });
+  if (cursor) params.set("cursor", cursor);
+  if (council) params.set("council", council);
+  if (status) params.set("status", status);
+  if (created_by) params.set("created_by", created_by);
+  const res = await fetch(`${BASE_URL}/clients?${params}`, {
+    headers: { "Authorization": `Bearer ${token}` },
+  });
+  if (!res.ok) throw new Error("Failed to fetch clients");
+  return await res.json();
+}
+
+// Ranked server-side search (name, ID, phone, email, current postcode)
+export async function searchClients(q, limit = 50) {
+  const token = localStorage.getItem("token");
+  const params = new URLSearchParams({ q, limit: String(limit) });
+  const res = await fetch(`${BASE_URL}/clients/search?${params}`, {
+    headers: { "Authorization": `Bearer ${token}` },
+  });
+  if (!res.ok) throw new Error("Failed to search clients");
+  const json = await res.json();
+  return json.items || [];
+}
+
 export async function fetchClientById(id) {
   const token = localStorage.getItem("token");
   const res = await fetch(`${BASE_URL}/clients/${id}`, {
@@ -295,6 +322,18 @@ export async function downloadAddressCSV(clientId) {
    return res.blob();
  }
 
+// CLIENT & SERVICE REPORT (field ids from the report picker, in column order)
+export async function downloadClientReportCSV(fieldIds, q = "") {
+  const token = localStorage.getItem("token");
+  const params = new URLSearchParams({ fields: fieldIds.join(",") });
+  if (q) params.set("q", q);
+  const res = await fetch(`${BASE_URL}/reports/clients.csv?${params}`, {
+    headers: { "Authorization": `Bearer ${token}` }
+  });
+  if (!res.ok) throw new Error("Failed to download client report CSV");
+  return res.blob();
+}
+
 // ---------- USER MANAGEMENT ----------
 export async function fetchUsers(token) {
   const res = await fetch(`${BASE_URL}/users`, {
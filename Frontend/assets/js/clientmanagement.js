@@ -4,33 +4,21 @@
 
 import { initHeader } from './header.js';
 import {
-  fetchClients,
-  fetchCouncilsEnabled,
+  fetchClientsPage,
+  searchClients,
   updateClient,
   deleteClient,
-  fetchClientAddresses,
-  fetchClientKins,
+  downloadClientReportCSV,
 } from './api.js';
 import { initRowPagination } from './row-pagination.js';
 import { renderServicePage } from './Services/services.js';
-import {
-  fetchAllServices,
-  fetchStatements,
-  uploadStatementsCSV,
-} from './Services/utils/serviceApi.js';
+import { uploadStatementsCSV } from './Services/utils/serviceApi.js';
 import { enforceAccessControl, validateSession, requirePermission } from './access-control.js';
 
-// =============================
-// GLOBAL STATE
-// =============================
-let allClients = [];
-let allServices = null; // cache
-const addressCache = {};
-const kinCache = {};
-
 // =============================
 // REPORT FIELD CONFIG
 // =============================
+// ids must match CLIENT_REPORT_FIELDS in Backend/main.py, which computes the values
 
 const REPORT_FIELD_GROUPS = [
   {
@@ -41,85 +29,71 @@ const REPORT_FIELD_GROUPS = [
         id: 'client_Title',
         label: 'Title',
         essential: true,
-        get: ({ client }) => client.title || '',
       },
       {
         id: 'client_first_name',
         label: 'First Name',
         essential: true,
-        get: ({ client }) => client.first_name || '',
       },
       {
         id: 'client_last_name',
         label: 'Last Name',
         essential: true,
-        get: ({ client }) => client.last_name || '',
       },
       {
         id: 'client_id',
         label: 'Client ID',
         essential: true,
-        get: ({ client }) => client.id || '',
       },
       {
         id: 'client_council',
         label: 'Council',
         essential: true,
-        get: ({ client }) => client.council || '',
       },
       {
         id: 'client_status',
         label: 'Status',
         essential: true,
-        get: ({ client }) => client.status || '',
       },
       {
         id: 'client_phone',
         label: 'Phone',
         essential: false,
-        get: ({ client }) => client.phone || '',
       },
       {
         id: 'client_email',
         label: 'Email',
         essential: false,
-        get: ({ client }) => client.email || '',
       },
       {
         id: 'client_dob',
         label: 'DOB',
         essential: false,
-        get: ({ client }) => client.dob || '',
       },
       {
         id: 'client_gender',
         label: 'Gender',
         essential: false,
-        get: ({ client }) => client.gender || '',
       },
       {
         id: 'client_disabilities',
         label: 'Disability',
         essential: false,
-        get: ({ client }) => client.disabilities?.join(", ") || "-",
       },	  
       {
         id: 'client_language',
         label: 'Language',
         essential: false,
-        get: ({ client }) => client.language || '',
       },
       {
         id: 'client_ethnicity_type',
         label: 'Ethnicity Type',
         essential: false,
-        get: ({ client }) => client.ethnicity_type || '',
       },
       {
         id: 'client_ethnicity',
         label: 'Ethnicity',
         essential: false,
-        get: ({ client }) => client.ethnicity || '',
       },
     ],
   },
@@ -131,37 +105,31 @@ const REPORT_FIELD_GROUPS = [
         id: 'addr_house_no',
         label: 'House Number',
         essential: false,
-        get: ({ address }) => (address?.house_no || ''),
       },
       {
         id: 'addr_street',
         label: 'Street',
         essential: false,
-        get: ({ address }) => (address?.street || ''),
       },
       {
         id: 'addr_city',
         label: 'City',
         essential: false,
-        get: ({ address }) => (address?.city || ''),
       },
       {
         id: 'addr_country',
         label: 'Country',
         essential: false,
-        get: ({ address }) => (address?.country || ''),
       },
       {
         id: 'addr_postcode',
         label: 'Postcode',
         essential: false,
-        get: ({ address }) => (address?.postcode || ''),
       },
       {
         id: 'addr_full',
         label: 'Full Address',
         essential: false,
-        get: ({ address }) => (address?.full || ''),
       },
     ],
   },
@@ -173,19 +141,16 @@ const REPORT_FIELD_GROUPS = [
         id: 'kin_name',
         label: 'Kin Name',
         essential: false,
-        get: ({ kin }) => (kin?.name || ''),
       },
       {
         id: 'kin_relationship',
         label: 'Kin Relationship',
         essential: false,
-        get: ({ kin }) => (kin?.relationship || ''),
       },
       {
         id: 'kin_email',
         label: 'Kin Email',
         essential: false,
-        get: ({ kin }) => (kin?.email || ''),
       },
     ],
   },
@@ -197,103 +162,86 @@ const REPORT_FIELD_GROUPS = [
         id: 'service_id',
         label: 'Service ID',
         essential: false,
-        get: ({ service }) => (service?.serviceId || service?.service_id || ''),
       },
       {
         id: 'service_type',
         label: 'Service Type',
         essential: false,
-        get: ({ service }) => (service?.serviceType || service?.service_type || ''),
       },
       {
         id: 'service_reference',
         label: 'YIL Reference No',
         essential: true,
-        get: ({ service }) => (service?.reference || ''),
       },
       {
         id: 'service_setup_fee',
         label: 'Setup Fee',
         essential: true,
-        get: ({ service }) => (service?.setupFee || service?.setup_fee || ''),
       },
       {
         id: 'service_setup_budget',
         label: 'Setup Budget',
         essential: false,
-        get: ({ service }) => String(service?.setupBudget ?? service?.setup_budget ?? ''),
       },
       {
         id: 'service_start_date',
         label: 'Start Date',
         essential: false,
-        get: ({ service }) => (service?.startDate || service?.start_date || ''),
       },
       {
         id: 'service_end_date',
         label: 'End Date',
         essential: false,
-        get: ({ service }) => (service?.endDate || service?.end_date || ''),
       },
       {
         id: 'service_referred_by',
         label: 'Referred By',
         essential: true,
-        get: ({ service }) => (service?.referredBy || service?.referred_by || ''),
       },
       {
         id: 'service_insurance',
         label: 'Insurance',
         essential: false,
-        get: ({ service }) => (service?.insurance || ''),
       },
       {
         id: 'service_monthly_fee',
         label: 'Monthly Fee',
         essential: false,
-        get: ({ service }) => String(service?.monthlyFee ?? service?.monthly_fee ?? ''),
       },
       {
         id: 'service_initial_fee',
         label: 'Initial Fee',
         essential: false,
-        get: ({ service }) => String(service?.initialFee ?? service?.initial_fee ?? ''),
       },
       {
         id: 'service_pension_setup',
         label: 'Pension Setup',
         essential: false,
-        get: ({ service }) => String(service?.pensionSetup ?? service?.pension_setup ?? ''),
       },
       {
         id: 'service_pension_fee',
         label: 'Pension Fee',
         essential: false,
-        get: ({ service }) => String(service?.pensionFee ?? service?.pension_fee ?? ''),
       },
       {
         id: 'service_annual_fee',
         label: 'Annual Fee',
         essential: false,
-        get: ({ service }) => String(service?.annualFee ?? service?.annual_fee ?? ''),
       },
       {
         id: 'service_year_end_fee',
         label: 'Year End Fee',
         essential: false,
-        get: ({ service }) => String(service?.yearEndFee ?? service?.year_end_fee ?? ''),
       },
       {
         id: 'service_carer_budget',
         label: 'Carer Budget',
         essential: false,
-        get: ({ service }) => String(service?.carerBudget ?? service?.carer_budget ?? ''),
       },
       {
         id: 'service_agency_budget',
         label: 'Agency Budget',
         essential: false,
-        get: ({ service }) => String(service?.agencyBudget ?? service?.agency_budget ?? ''),
       },
     ],
   },
@@ -305,22 +253,16 @@ const REPORT_FIELD_GROUPS = [
         id: 'total_paid',
         label: 'Total Paid (Debit)',
         essential: true,
-        get: ({ totals }) =>
-          totals ? totals.totalPaid.toFixed(2) : '',
       },
       {
         id: 'total_remittance',
         label: 'Total Remittance (Credit)',
         essential: true,
-        get: ({ totals }) =>
-          totals ? totals.totalRemit.toFixed(2) : '',
       },
       {
         id: 'balance',
         label: 'Balance (Credit - Debit)',
         essential: true,
-        get: ({ totals }) =>
-          totals ? totals.balance.toFixed(2) : '',
       },
     ],
   },
@@ -347,10 +289,8 @@ document.addEventListener('DOMContentLoaded', async () => {
   // ✅ Only load clients if user can VIEW
   requirePermission('client', 'view', async () => {
     try {
-      allClients = await fetchClients();
-      await fetchCouncilsEnabled();
-      setupPagination(allClients, tbody);
-      bindClientSearch(allClients, tbody);
+      await setupServerPagination(tbody);
+      bindClientSearch(tbody);
 
       const params = new URLSearchParams(window.location.search);
       const openFor = params.get('openServicesFor');
@@ -486,21 +426,85 @@ function setupPagination(clientsArr, tbody) {
   paginationContainer.appendChild(pager);
 }
 
+// =============================
+// SERVER PAGINATION (keyset cursors)
+// =============================
+const PAGE_SIZE = 100; // matches row-pagination.js
+
+async function setupServerPagination(tbody) {
+  const paginationContainer = document.querySelector('.pagination');
+  const pages = {};
+  const cursors = [null]; // cursors[p - 1] loads page p
+
+  const first = await fetchClientsPage({ limit: PAGE_SIZE });
+  pages[1] = first.items;
+  cursors[1] = first.next_cursor;
+
+  if (!paginationContainer) {
+    renderClients(first.items, tbody);
+    return;
+  }
+  paginationContainer.innerHTML = '';
+
+  // page N's cursor only exists once page N-1 has loaded, so page loads run one at a time,
+  // in order; quick clicks queue up behind the fetch in flight
+  let currentPage = 1;
+  let loading = Promise.resolve();
+  const loadPage = (page) => {
+    loading = loading.catch(() => {}).then(async () => {
+      for (let p = 2; p <= page && !pages[page]; p++) {
+        if (pages[p]) continue;
+        if (!cursors[p - 1]) break;
+        const res = await fetchClientsPage({ limit: PAGE_SIZE, cursor: cursors[p - 1] });
+        pages[p] = res.items;
+        cursors[p] = res.next_cursor;
+      }
+    });
+    return loading;
+  };
+
+  const pager = initRowPagination({
+    totalItems: first.total,
+    onPageChange: async (page) => {
+      currentPage = page;
+      try {
+        await loadPage(page);
+        // a later click may have moved on while this page was loading
+        if (page === currentPage && pages[page]) renderClients(pages[page], tbody);
+      } catch (err) {
+        console.error('❌ Failed to load clients page', err);
+      }
+    },
+  });
+
+  paginationContainer.appendChild(pager);
+}
+
 // =============================
 // SEARCH
 // =============================
-function bindClientSearch(clientsArr, tbody) {
+function bindClientSearch(tbody) {
   const searchInput = document.getElementById('clientSearch');
   if (!searchInput) return;
 
+  let timer = null;
+  let latest = 0;
   searchInput.addEventListener('input', () => {
-    const q = searchInput.value.toLowerCase().trim();
-    const filtered = clientsArr.filter(
-      (c) =>
-        (`${c.first_name || ''} ${c.last_name || ''}`.toLowerCase().includes(q)) ||
-        String(c.id).toLowerCase().includes(q)
-    );
-    setupPagination(filtered, tbody);
+    clearTimeout(timer);
+    timer = setTimeout(async () => {
+      const q = searchInput.value.trim();
+      const ticket = ++latest;
+      try {
+        if (!q) {
+          await setupServerPagination(tbody);
+          return;
+        }
+        const results = await searchClients(q);
+        if (ticket === latest) setupPagination(results, tbody);
+      } catch (err) {
+        console.error('❌ Client search failed', err);
+      }
+    }, 250);
   });
 }
 
@@ -637,7 +641,6 @@ async function generateDynamicClientCSV() {
   const modal = document.getElementById('clientReportModal');
   if (!modal) return;
 
-  const fieldMap = buildFieldMap();
   const selectedFieldIds = Array.from(
     modal.querySelectorAll('.report-checkbox input[type="checkbox"]:checked')
   ).map((cb) => cb.dataset.fieldId);
@@ -647,105 +650,12 @@ async function generateDynamicClientCSV() {
     return;
   }
 
-  // build flat ordered fieldDefs array
-  const selectedFields = [];
-  for (const group of REPORT_FIELD_GROUPS) {
-    for (const f of group.fields) {
-      if (selectedFieldIds.includes(f.id)) selectedFields.push(f);
-    }
-  }
-
   // search filter
   const searchInput = document.getElementById('clientSearch');
   const q = (searchInput?.value || '').toLowerCase().trim();
 
-  if (!allClients.length) {
-    allClients = await fetchClients();
-  }
-
-  const filteredClients = allClients.filter(
-    (c) =>
-      (`${c.title|| ''} ${c.first_name || ''} ${c.last_name || ''}`.toLowerCase().includes(q)) ||
-      String(c.id).toLowerCase().includes(q)
-  );
-
-  if (!allServices) {
-    allServices = await fetchAllServices();
-  }
-
-  // CSV header
-  let csv = selectedFields.map((f) => safeCsvValue(f.label)).join(',') + '\n';
-
-  // loop through clients
-  for (const client of filteredClients) {
-    const clientId = client.id;
-
-    // resolve address if any address field selected
-    let address = null;
-    if (selectedFieldIds.some((id) => id.startsWith('addr_'))) {
-      address = await getCurrentAddressForClient(clientId);
-    }
-
-    // resolve kin if any kin field selected
-    let kin = null;
-    if (selectedFieldIds.some((id) => id.startsWith('kin_'))) {
-      kin = await getCurrentKinForClient(clientId);
-    }
-
-    const clientServices = allServices.filter(
-      (s) => (s.client_id || s.clientId) === clientId
-    );
-
-    if (!clientServices.length) {
-      // create one row with no service/totals
-      const rowContext = {
-        client,
-        address,
-        kin,
-        service: null,
-        totals: null,
-      };
-      const rowValues = selectedFields.map((f) => safeCsvValue(f.get(rowContext)));
-      csv += rowValues.join(',') + '\n';
-      continue;
-    }
-
-    // each service as a row
-    for (const svc of clientServices) {
-      const serviceId = svc.service_id || svc.serviceId;
-
-      // totals
-      let totals = null;
-      if (selectedFieldIds.some((id) =>
-        id === 'total_paid' ||
-        id === 'total_remittance' ||
-        id === 'balance'
-      )) {
-        const stmts = await fetchStatements(serviceId);
-        const totalPaid = stmts.reduce((a, s) => a + (Number(s.debit) || 0), 0);
-        const totalRemit = stmts.reduce((a, s) => a + (Number(s.credit) || 0), 0);
-        totals = {
-          totalPaid,
-          totalRemit,
-          balance: totalRemit - totalPaid,
-        };
-      }
-
-      const rowContext = {
-        client,
-        address,
-        kin,
-        service: svc,
-        totals,
-      };
-
-      const rowValues = selectedFields.map((f) => safeCsvValue(f.get(rowContext)));
-      csv += rowValues.join(',') + '\n';
-    }
-  }
-
-  // download CSV
-  const blob = new Blob([csv], { type: 'text/csv;charset=utf-8;' });
+  // rows (and statement totals) are built server-side in a few set-based queries
+  const blob = await downloadClientReportCSV(selectedFieldIds, q);
   const url = URL.createObjectURL(blob);
   const a = document.createElement('a');
   a.href = url;
@@ -756,100 +666,6 @@ async function generateDynamicClientCSV() {
   URL.revokeObjectURL(url);
 }
 
-// =============================
-// ADDRESS / KIN HELPERS FOR CSV
-// =============================
-async function getCurrentAddressForClient(clientId) {
-  if (Object.prototype.hasOwnProperty.call(addressCache, clientId)) {
-    return addressCache[clientId];
-  }
-
-  try {
-    const list = (await fetchClientAddresses(clientId)) || [];
-    if (!list.length) {
-      addressCache[clientId] = null;
-      return null;
-    }
-
-    const hasFlag = list.some((a) =>
-      Object.prototype.hasOwnProperty.call(a, 'is_current')
-    );
-    let current = null;
-    if (hasFlag) {
-      current = list.find((a) => a.is_current === true) || list[0];
-    } else {
-      current = list[0];
-    }
-
-    const addr = {
-      house_no: current.house_no || '',
-      street: current.street || '',
-      city: current.city || '',
-      country: current.country || '',
-      postcode: current.postcode || '',
-    };
-    addr.full = [addr.house_no, addr.street, addr.city, addr.country, addr.postcode]
-      .filter(Boolean)
-      .join(', ');
-
-    addressCache[clientId] = addr;
-    return addr;
-  } catch (e) {
-    console.warn('Failed to load address for CSV', e);
-    addressCache[clientId] = null;
-    return null;
-  }
-}
-
-async function getCurrentKinForClient(clientId) {
-  if (Object.prototype.hasOwnProperty.call(kinCache, clientId)) {
-    return kinCache[clientId];
-  }
-
-  try {
-    const list = (await fetchClientKins(clientId)) || [];
-    if (!list.length) {
-      kinCache[clientId] = null;
-      return null;
-    }
-
-    const hasFlag = list.some((k) =>
-      Object.prototype.hasOwnProperty.call(k, 'is_current')
-    );
-    let current = null;
-    if (hasFlag) {
-      current = list.find((k) => k.is_current === true) || list[0];
-    } else {
-      current = list[0];
-    }
-
-    const kin = {
-      name: current.name || current.kin_name || '',
-      relationship: current.relationship || current.kin_relationship || '',
-      email: current.email || '',
-    };
-
-    kinCache[clientId] = kin;
-    return kin;
-  } catch (e) {
-    console.warn('Failed to load kin for CSV', e);
-    kinCache[clientId] = null;
-    return null;
-  }
-}
-
-// =============================
-// CSV VALUE ESCAPE
-// =============================
-function safeCsvValue(v) {
-  if (v === null || v === undefined) return '';
-  const s = String(v);
-  if (s.includes('"') || s.includes(',') || s.includes('\n')) {
-    return `"${s.replace(/"/g, '""')}"`;
-  }
-  return s;
-}
-
 // ------------------ BULK STATEMENT UPLOAD (CSV) ------------------
 const uploadBtn = document.getElementById("uploadStatementBtn");
 const fileInput = document.getElementById("statementFileInput");